@@ -1,9 +1,18 @@
 import unittest
 import random
+from array import array
 
 from graphviz import Digraph
 
-from common.range_map import RangeMap, TreeRangeNode
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from common.range_map import RangeMap, TreeRangeNode, FrozenRangeMap
+from common.table_compress import CombTable
+from lex.lexer import Lexer
+from lex.regex_compiler import RegexLexer
 
 tree_graph = Digraph(filename='tree', format='png', graph_attr={'fontname': 'Microsoft YaHei'},
         node_attr={'fontname': 'Microsoft YaHei'},
@@ -71,3 +80,132 @@ class TestRangeMap(unittest.TestCase):
         rm.insert(99, 100)
 
         draw_tree(rm)
+
+
+token_spec = [
+    ('KEYWORD', r'int|float|char|if|else|while|return'),
+    ('NUMBER', r'[0-9]+\.[0-9]+|[0-9]+'),
+    ('OP', r'[+\-*/=<>!]|>=|<=|!=|=='),
+    ('SEPARATOR', r'[(),;{}]'),
+    ('ID', r'[a-zA-Z_][A-Za-z0-9_]*'),
+]
+
+
+class TestCombTable(unittest.TestCase):
+    def test_dfa_table(self):
+        table = Lexer(token_spec).table
+        comb = table.compress()
+        for state in range(table.state_count):
+            for cls in range(table.class_count):
+                self.assertEqual(comb.lookup(state, cls), table.translate_to(state, cls))
+        self.assertLess(comb.nbytes, comb.dense_nbytes)
+
+    def test_mapping(self):
+        rnd = random.Random(2)
+        mapping = {}
+        for row in range(40):
+            for col in rnd.sample(range(30), rnd.randint(0, 12)):
+                mapping[(f"s{row}", ("t", col))] = rnd.choice(["r1", "r2", "s1", "s2", "s3"])
+        mapping[("s0", ("t", 0))] = "s1"
+
+        exact = CombTable.from_mapping(mapping)
+        reducing = CombTable.from_mapping(mapping, reducible=lambda value: value.startswith("r"))
+        for row in range(41):
+            for col in range(31):
+                key = (f"s{row}", ("t", col))
+                self.assertEqual(exact.get(*key), mapping.get(key))
+                self.assertEqual(key in exact, key in mapping)
+                if key in mapping:
+                    self.assertEqual(reducing[key], mapping[key])
+                    self.assertEqual(exact[key], mapping[key])
+                elif reducing.get(*key) is not None:
+                    self.assertTrue(reducing.get(*key).startswith("r"))
+
+        with self.assertRaises(KeyError):
+            exact[("s0", ("t", 100))]
+
+
+class TestFrozenRangeMap(unittest.TestCase):
+    def test_lookup(self):
+        _, range_map = RegexLexer.parse_group([("a", "[a-z]+"), ("b", "[你-好]|x|\\.|é")])
+        frozen = range_map.freeze()
+
+        for c in [0, 10, ord('a'), ord('q'), ord('z'), ord('.'), 0xe9, 0xff, 0x100, ord('你'), ord('好'), 0x10FFFF]:
+            self.assertEqual(frozen.lookup(c), range_map.search(c).meta, c)
+        self.assertEqual(frozen.lookup('x'), range_map.search('x').meta)
+
+    def test_classify(self):
+        _, range_map = RegexLexer.parse_group([("a", "[a-z]+"), ("b", "[你-好]|x|\\.|é")])
+        frozen = range_map.freeze()
+        for text in ["abc.xé", "a你b好c\U0010FFFF", ""]:
+            self.assertEqual(list(frozen.classify(text)), [frozen.lookup(c) for c in text])
+        self.assertEqual(list(frozen.classify([ord('a'), 0x4f60])), [frozen.lookup('a'), frozen.lookup(0x4f60)])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_classify_numpy(self):
+        frozen = FrozenRangeMap([(10, 20, 0), (20, 30, 1), (300, 400, 2)])
+        text = "\x0f\x05" + chr(350) + chr(20) + chr(1000)
+        expected = [0, FrozenRangeMap.MISSING, 2, 1, FrozenRangeMap.MISSING]
+        self.assertEqual(frozen.classify_numpy(text).tolist(), expected)
+        self.assertEqual(frozen.classify_numpy(array('I', map(ord, text))).tolist(), expected)
+        self.assertEqual(frozen.classify_numpy(b"\x0f\x05").tolist(), expected[:2])
+        self.assertEqual(list(frozen.classify(text * FrozenRangeMap.NUMPY_THRESHOLD)),
+                         expected * FrozenRangeMap.NUMPY_THRESHOLD)
+
+    def test_gaps(self):
+        frozen = FrozenRangeMap([(10, 20, 0), (20, 30, 1), (300, 400, 2)])
+        self.assertEqual(len(frozen), 3)
+        self.assertEqual([frozen.lookup(c) for c in (0, 10, 19, 20, 29, 30, 299, 300, 399, 400, 5000)],
+                         [None, 0, 0, 1, 1, None, None, 2, 2, None, None])
+        self.assertEqual(list(frozen.classify([5, 15, 350, 500])), [FrozenRangeMap.MISSING, 0, 2, FrozenRangeMap.MISSING])
+        self.assertEqual(list(frozen.classify("\x05\x0f")), [FrozenRangeMap.MISSING, 0])
+        with self.assertRaises(TypeError):
+            frozen.boundaries[0] = 1
+        with self.assertRaises(ValueError):
+            FrozenRangeMap([(10, 20, 0), (15, 30, 1)])
+
+    def test_disjoint_ranges(self):
+        rnd = random.Random(0)
+        for _ in range(200):
+            rm = RangeMap()
+            rm.insert(0, 1000)
+            cuts = {0, 1000}
+            for _ in range(rnd.randint(1, 30)):
+                beg = rnd.randint(0, 999)
+                end = rnd.randint(beg + 1, min(1000, beg + 50))
+                rm.insert(beg, end)
+                cuts.update((beg, end))
+
+            ranges = []
+            rm.dfs(ldr_handler=lambda node, *_: ranges.append((node.beg, node.end)))
+            self.assertEqual([beg for beg, _ in ranges] + [1000], sorted(cuts))
+            self.assertTrue(all(ranges[i][1] == ranges[i + 1][0] for i in range(len(ranges) - 1)))
+
+
+class TestRangeMapBuild(unittest.TestCase):
+    def test_from_boundaries(self):
+        rnd = random.Random(3)
+        for _ in range(50):
+            cuts = {0, 1000}
+            inserted = RangeMap()
+            inserted.insert(0, 1000)
+            for _ in range(rnd.randint(0, 40)):
+                beg = rnd.randint(0, 998)
+                end = rnd.randint(beg + 1, 999)
+                inserted.insert(beg, end)
+                cuts.update((beg, end))
+
+            built = RangeMap.from_boundaries(cuts)
+            expected, ranges, heights = [], [], []
+            inserted.dfs(ldr_handler=lambda node, *_: expected.append((node.beg, node.end)))
+            built.dfs(ldr_handler=lambda node, *_: ranges.append((node.beg, node.end, node.meta)))
+            built.dfs(dlr_handler=lambda node, *_: heights.append(node.height))
+
+            self.assertEqual([(beg, end) for beg, end, _ in ranges], expected)
+            self.assertEqual([meta for _, _, meta in ranges], list(range(len(ranges))))
+            self.assertLessEqual(max(heights), len(ranges).bit_length())
+            for c in range(0, 1000, 13):
+                self.assertEqual(built.search(c).beg, inserted.search(c).beg)
+
+        with self.assertRaises(ValueError):
+            RangeMap.from_boundaries([0, 5, 9], ["a"])
@@ -156,6 +156,28 @@ class TestParser(unittest.TestCase):
 
         draw(lr1_parser.state2collection_table, lr1_parser.action_goto_table, "lalr1_table")
 
+    def test_compress_table(self):
+        production = ProductionBuilder([
+            ("S'", ("L=R", "R"), ('', '')),
+            ("L", ("*R", "i"), ('', '')),
+            ("R", ("L", ), ('', )),
+        ], ['=', '*',])
+        lr1_parser = LR1Parser(production.parse(), "S'")
+        table = lr1_parser.action_goto_table
+        columns = {column for _, column in table}
+
+        exact = lr1_parser.compress_table(default_reductions=False)
+        reducing = lr1_parser.compress_table()
+        for state in lr1_parser.state2collection_table:
+            for column in columns:
+                key = (state, column)
+                self.assertEqual(exact.get(*key), table.get(key))
+                if key in table:
+                    self.assertEqual(reducing[key], table[key])
+                elif reducing.get(*key) is not None:
+                    self.assertEqual(reducing.get(*key).cell_type, ParserType.REDUCE)
+        self.assertLess(exact.nbytes, exact.dense_nbytes)
+
     def test_rd_parser(self):
         production = ProductionBuilder([
             ("S", ("(A)", ), ("", )),
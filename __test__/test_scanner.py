@@ -0,0 +1,509 @@
+import asyncio
+import io
+import os
+import pickle
+import random
+import sys
+import tempfile
+import unittest
+
+from common.common_type import EPSILON
+from lex.codegen import load_scanner
+from lex.dfa import DFA
+from lex.lazy_dfa import LazyDFA
+from lex.lexer import Lexer
+from lex.lexer_builder import CLexerBuilder, CLayeringLexerBuilder
+from lex.keyword_table import KeywordTable
+from lex.lexer_cache import LexerCache
+from lex.nfa import NFA
+from lex.stream_scanner import StreamScanner
+from lex.regex_compiler import RegexLexer, RegexCompiler, N2DConvertor, DFAOptimizer, AlphabetMerger, \
+    DFATrimmer
+
+token_spec = [
+    ('KEYWORD', r'int|float|char|if|else|while|return'),
+    ('NUMBER', r'[0-9]+\.[0-9]+|[0-9]+'),
+    ('OP', r'[+\-*/=<>!]|>=|<=|!=|=='),
+    ('SEPARATOR', r'[(),;{}]'),
+    ('ID', r'[a-zA-Z_][A-Za-z0-9_]*'),
+    ('STRING', r'"[^"]*"'),
+    ('SPACE', '[ \n\t]+'),
+]
+
+source = """
+int main() {
+    int a1 = 10;
+    float b = 3.14;
+    if (a1 >= b) return "done";
+}
+"""
+
+
+def naive_scan(lexer: Lexer, text: str):
+    """
+    reference implementation, walks DFA.translate_to char by char
+    """
+    dfa = lexer.dfa
+    result = []
+    pos = 0
+    while pos < len(text):
+        state = lexer.origin
+        last = None
+        i = pos
+        while i < len(text):
+            state = dfa.translate_to(state, dfa.range_map.search(text[i]).meta)
+            if state is None:
+                break
+            i += 1
+            if dfa.nodes[state].accept:
+                last = (dfa.nodes[state].label, pos, i)
+        result.append(last)
+        pos = last[2]
+    return result
+
+
+class TestScanner(unittest.TestCase):
+    def setUp(self):
+        self.lexer = Lexer(token_spec)
+
+    def test_scan(self):
+        tokens = list(self.lexer.scan(source))
+        self.assertEqual(tokens, naive_scan(self.lexer, source))
+
+        values = [(kind, source[start:end]) for kind, start, end in tokens if kind != 'SPACE']
+        self.assertEqual(values[:6], [
+            ('KEYWORD', 'int'), ('ID', 'main'), ('SEPARATOR', '('), ('SEPARATOR', ')'),
+            ('SEPARATOR', '{'), ('KEYWORD', 'int'),
+        ])
+        self.assertIn(('NUMBER', '3.14'), values)
+        self.assertIn(('OP', '>='), values)
+        self.assertIn(('STRING', '"done"'), values)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            built = Lexer(token_spec, cache_dir=cache_dir)
+            self.assertTrue(os.path.exists(LexerCache(cache_dir).path(token_spec, False)))
+
+            loaded = Lexer(token_spec, cache_dir=cache_dir)
+            self.assertEqual(len(loaded.dfa.nodes), len(built.dfa.nodes))
+            self.assertEqual(list(loaded.scan(source)), list(built.scan(source)))
+
+            with open(LexerCache(cache_dir).path(token_spec, False), "wb") as f:
+                f.write(b"broken")
+            self.assertEqual(list(Lexer(token_spec, cache_dir=cache_dir).scan(source)), list(built.scan(source)))
+
+            with self.assertRaises(ValueError):
+                Lexer(token_spec, cache_dir=cache_dir, lazy=True)
+
+        # labels are literals, no pickle involved
+        labels = [None, True, 1, -(1 << 70), 2.5, "名字", b"raw", ("KEYWORD", (0, False))]
+        dfa = DFA()
+        dfa.range_map = built.dfa.range_map
+        for state, label in enumerate(labels):
+            dfa.add_node(state, accept=label is not None, label=label)
+        dfa.add_edge(0, 1, 0)
+        origin, loaded = LexerCache.loads(LexerCache.dumps(0, dfa))
+        self.assertEqual(origin, 0)
+        self.assertEqual([(type(node.label), node.label) for node in loaded.nodes.values()],
+                         [(type(label), label) for label in labels])
+        self.assertEqual(loaded.edges, dfa.edges)
+
+        data = LexerCache.dumps(0, dfa)
+        for broken in (data[:-1], data + b"\0", data[:LexerCache.HEADER.size] + b"\xff" * 24):
+            with self.assertRaises(ValueError):
+                LexerCache.loads(broken)
+
+        dfa.nodes[0].label = object()
+        with self.assertRaises(ValueError):
+            LexerCache.dumps(0, dfa)
+
+    def test_lazy(self):
+        expected = list(self.lexer.scan(source))
+        self.assertEqual(list(Lexer(token_spec, lazy=True).scan(source)), expected)
+
+        small = Lexer(token_spec, lazy=True, cache_size=4)
+        self.assertEqual(list(small.scan(source)), expected)
+        self.assertLessEqual(small.table.state_count, 4)
+        self.assertGreater(small.table.flush_count, 0)
+
+        for construction in (RegexCompiler.Construction.THOMPSON, RegexCompiler.Construction.DIRECT):
+            with self.assertRaises(ValueError):
+                Lexer(token_spec, lazy=True, construction=construction)
+
+        groups, range_map = RegexLexer.parse_group(token_spec)
+        origin, nfa = RegexCompiler().compile_group(groups, range_map)      # thompson nfa, closures on demand
+        thompson = LazyDFA(nfa, origin, cache_size=4)
+        self.assertEqual(list(thompson.scan(source)), expected)
+        self.assertGreater(thompson.flush_count, 0)
+
+    def test_stream(self):
+        text = source + '"字符串"' + source
+        expected = [(kind, start, end, text[start:end]) for kind, start, end in self.lexer.scan(text)]
+
+        for chunk_size in (1, 2, 3, 7, 64, 1 << 16):
+            self.assertEqual(list(self.lexer.tokenize_stream(io.StringIO(text), chunk_size)), expected)
+            self.assertEqual(list(self.lexer.tokenize_stream(io.BytesIO(text.encode("utf-8")), chunk_size)), expected)
+
+        # a literal spanning many chunks is collected, then joined once
+        literal = '"' + "x" * 100000 + '"'
+        scanner = StreamScanner(self.lexer.table)
+        for i in range(0, len(literal) - 1, 7):
+            self.assertEqual(scanner.feed(literal[i:min(i + 7, len(literal) - 1)]), [])
+        self.assertEqual(scanner.pending, len(literal) - 1)
+        self.assertEqual(scanner.feed('";'), [('STRING', 0, len(literal), literal)])
+        self.assertEqual(scanner.close(), [('SEPARATOR', len(literal), len(literal) + 1, ';')])
+
+        with self.assertRaises(RuntimeError):
+            list(self.lexer.tokenize_stream(io.StringIO("int a = 1 @ 2;"), 4))
+
+    def test_atokenize(self):
+        text = source + '"字符串"' + source
+        data = text.encode("utf-8")
+        expected = list(self.lexer.tokenize_stream(io.StringIO(text)))
+
+        async def collect(piece: int, chunk_size: int, slice_size: int):
+            reader = asyncio.StreamReader()
+            for i in range(0, len(data), piece):
+                reader.feed_data(data[i:i + piece])
+            reader.feed_eof()
+
+            ticks = 0
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0)
+
+            task = asyncio.create_task(ticker())
+            tokens = [token async for token in self.lexer.atokenize(reader, chunk_size, slice_size=slice_size)]
+            task.cancel()
+            return tokens, ticks
+
+        for piece, chunk_size, slice_size in ((1, 1, 1), (5, 2, 1), (64, 7, 3), (len(data), 1 << 16, 4096)):
+            self.assertEqual(asyncio.run(collect(piece, chunk_size, slice_size))[0], expected)
+
+        # one big chunk is scanned slice by slice, other tasks run in between
+        tokens, ticks = asyncio.run(collect(len(data), 1 << 16, 16))
+        self.assertEqual(tokens, expected)
+        self.assertGreaterEqual(ticks, len(data) // 16)
+
+        async def broken():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"int a = 1 @ 2;")
+            reader.feed_eof()
+            return [token async for token in self.lexer.atokenize(reader, 4)]
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(broken())
+
+    def test_scan_file(self):
+        text = source + '"字符串 🙂"' + source
+        data = text.encode("utf-8")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "main.c")
+            with open(path, "wb") as f:
+                f.write(data)
+
+            with self.lexer.scan_file(path) as mapped:
+                tokens = list(mapped)
+                lexemes = [(kind, mapped.lexeme(start, end)) for kind, start, end in tokens]
+
+            self.assertEqual(lexemes, [(kind, text[start:end]) for kind, start, end in self.lexer.scan(text)])
+            self.assertEqual(tokens[-1][2], len(data))
+
+            with open(path, "wb"):
+                pass
+            with self.lexer.scan_file(path) as mapped:
+                self.assertEqual(list(mapped), [])
+
+    def test_tokenize(self):
+        buffer = self.lexer.tokenize(source)
+        expected = list(self.lexer.scan(source))
+        self.assertEqual(len(buffer), len(expected))
+        self.assertEqual([token[:3] for token in buffer], expected)
+        self.assertEqual([token[3] for token in buffer], [source.count("\n", 0, start) for _, start, _ in expected])
+        self.assertEqual(list(Lexer(token_spec, lazy=True).tokenize(source)), list(buffer))
+
+        view = buffer[2:6]
+        self.assertEqual(list(view), list(buffer)[2:6])
+        self.assertEqual(view[-1], buffer[5])
+        self.assertEqual(list(view.starts), [token[1] for token in buffer][2:6])
+        self.assertEqual(view.label_view()[0], buffer.label(2))
+        with self.assertRaises(RuntimeError):
+            view.append('ID', 0, 1)
+        with self.assertRaises(IndexError):
+            view[4]
+
+        terminals = buffer.label_view()
+        self.assertEqual(terminals[0], 'SPACE')
+        self.assertEqual(terminals[1], 'KEYWORD')
+
+    def test_tokenize_many(self):
+        texts = [source * (i + 1) for i in range(5)] + [""]
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i, text in enumerate(texts):
+                paths.append(os.path.join(directory, f"{i}.c"))
+                with open(paths[-1], "w", encoding="utf-8") as f:
+                    f.write(text)
+
+            for workers in (1, 2):
+                buffers = self.lexer.tokenize_many(paths, workers=workers)
+                self.assertEqual([list(buffer) for buffer in buffers],
+                                 [list(self.lexer.tokenize(text)) for text in texts])
+
+    def test_compile_scanner(self):
+        text = source + '"字符串 🙂"' + source
+        expected = list(self.lexer.scan(text))
+        expected_bytes = list(self.lexer.table.scan_bytes(text.encode("utf-8")))
+
+        with tempfile.TemporaryDirectory() as directory:
+            scanner = self.lexer.compile_scanner(os.path.join(directory, "generated_scanner.py"))
+            self.assertEqual(list(self.lexer.scan(text)), expected)
+            self.assertEqual(list(scanner.module.scan(text)), expected)
+            self.assertEqual(list(scanner.scan_bytes(text.encode("utf-8"))), expected_bytes)
+            self.assertEqual(list(self.lexer.tokenize(text))[-1][:3], expected[-1])
+
+            with self.assertRaises(RuntimeError):
+                list(scanner.scan("int a = 1 @ 2;"))
+
+            # same file name in another directory is another module
+            os.mkdir(os.path.join(directory, "other"))
+            other = Lexer(token_spec[1:]).compile_scanner(os.path.join(directory, "other", "generated_scanner.py"))
+            self.assertNotEqual(other.module.__name__, scanner.module.__name__)
+            self.assertIs(sys.modules[scanner.module.__name__], scanner.module)
+            self.assertNotIn("generated_scanner", sys.modules)
+            self.assertEqual(list(scanner.scan(text)), expected)
+
+            with self.assertRaises(RuntimeError):
+                load_scanner(os.path.join(directory, "generated_scanner.py"), "os")
+            self.assertEqual(pickle.loads(pickle.dumps(scanner)).module.__name__, scanner.module.__name__)
+
+    def test_keywords(self):
+        keywords = KeywordTable({keyword: 'KEYWORD' for keyword in token_spec[0][1].split('|')}, target='ID')
+        lexer = Lexer(token_spec[1:], keywords=keywords)
+        self.assertLess(len(lexer.dfa.nodes), len(self.lexer.dfa.nodes))
+
+        text = source + "intx iff whil while_ _int"
+        expected = list(self.lexer.scan(text))
+        self.assertEqual(list(lexer.scan(text)), expected)
+        self.assertEqual(list(lexer.tokenize(text)), list(self.lexer.tokenize(text)))
+        self.assertEqual([token[:3] for token in lexer.tokenize_stream(io.StringIO(text), 5)], expected)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "main.c")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            with lexer.scan_file(path) as mapped:
+                self.assertEqual(list(mapped), expected)
+            self.assertEqual(list(lexer.tokenize_many([path], workers=1)[0]), list(self.lexer.tokenize(text)))
+
+        self.assertEqual(keywords.lookup("a while b", 2, 7), 'KEYWORD')
+        self.assertIsNone(keywords.lookup("a whale b", 2, 7))
+        self.assertEqual(keywords.lookup_bytes(b"if", 0, 2), 'KEYWORD')
+
+    def test_scan_batch(self):
+        texts = ["a1 = b + 10;", "", "if (x) return \"s\";", "while\n  x", "int"]
+        buffer, bounds = self.lexer.scan_batch(texts)
+        self.assertEqual(len(bounds), len(texts) + 1)
+        self.assertEqual(bounds[-1], len(buffer))
+        for i, text in enumerate(texts):
+            self.assertEqual(list(buffer[bounds[i]:bounds[i + 1]]), list(self.lexer.tokenize(text)))
+
+        lazy_buffer, lazy_bounds = Lexer(token_spec, lazy=True).scan_batch(texts)
+        self.assertEqual(list(lazy_buffer), list(buffer))
+        self.assertEqual(lazy_bounds, bounds)
+        with self.assertRaises(RuntimeError):
+            self.lexer.scan_batch(["a", "b @"])
+
+        keywords = KeywordTable({keyword: 'KEYWORD' for keyword in token_spec[0][1].split('|')}, target='ID')
+        buffer, bounds = Lexer(token_spec[1:], keywords=keywords).scan_batch(iter(texts))
+        self.assertEqual(list(buffer), [token for text in texts for token in self.lexer.tokenize(text)])
+
+    def test_incremental(self):
+        rand = random.Random(7)
+        alphabet = 'int x=1.5;()\n "ab" if'
+        incremental = self.lexer.incremental(source * 3)
+        self.assertEqual(list(incremental.tokens), list(self.lexer.tokenize(source * 3)))
+
+        for _ in range(500):
+            text = incremental.text
+            offset = rand.randint(0, len(text))
+            deleted = rand.randint(0, min(3, len(text) - offset))
+            inserted = "".join(rand.choice(alphabet) for _ in range(rand.randint(0, 3)))
+            edited = text[:offset] + inserted + text[offset + deleted:]
+            try:
+                expected = list(self.lexer.tokenize(edited))
+            except RuntimeError:
+                with self.assertRaises(RuntimeError):
+                    incremental.edit(offset, deleted, inserted)
+                self.assertEqual(incremental.text, text)
+                continue
+
+            first, removed, added = incremental.edit(offset, deleted, inserted)
+            self.assertEqual(incremental.text, edited)
+            self.assertEqual([incremental.token(i) for i in range(len(incremental))], expected)
+            self.assertEqual(len(expected) - added, len(self.lexer.tokenize(text)) - removed)
+        self.assertEqual(list(incremental.tokens), list(self.lexer.tokenize(incremental.text)))
+
+        incremental = self.lexer.incremental(source * 100)
+        first, removed, added = incremental.edit(len(source) * 50 + 5, 0, "x")
+        self.assertLessEqual(removed + added, 4)
+
+    def test_unexpected_character(self):
+        with self.assertRaises(RuntimeError):
+            list(self.lexer.scan("int a = 1 @ 2;"))
+        with self.assertRaises(RuntimeError):
+            self.lexer.tokenize("int a = 1 @ 2;")
+
+    def test_advance_classes(self):
+        table = self.lexer.table
+        text = source + "a @ 1"
+        classes = table.classify_text(text)
+        self.assertEqual(len(classes), len(text) + 1)
+        for pos in range(len(text)):
+            # stops at the same place, the boundary class after the end is a dead transition
+            self.assertEqual(table.advance_classes(classes, pos, table.origin)[1:],
+                             table.advance(text, pos, table.origin)[1:])
+
+
+class TestLayeredScanner(unittest.TestCase):
+    def test_scan(self):
+        builder = CLayeringLexerBuilder()
+        text = 'int x = 0x1Fu; /* a ** b */ char *s = "say \\"hi\\"";\n// done\nx = sizeof x >= 017;'
+        tokens = [(label, text[start:end]) for label, start, end in builder.scan(text)]
+        self.assertEqual(tokens, [
+            ('KEYWORD_INT', 'int'), ('IDENTIFIER', 'x'), ('OP_ASSIGN', '='), ('UNSIGNED_HEX_INTEGER', '0x1Fu'),
+            ('TERMINATE', ';'), ('KEYWORD_CHAR', 'char'), ('OP_MUL ', '*'), ('IDENTIFIER', 's'), ('OP_ASSIGN', '='),
+            ('STRING', '"say \\"hi\\""'), ('TERMINATE', ';'), ('IDENTIFIER', 'x'), ('OP_ASSIGN', '='),
+            ('KEYWORD_SIZEOF', 'sizeof'), ('IDENTIFIER', 'x'), ('OP_GE', '>='), ('OCT_INTEGER', '017'), ('TERMINATE', ';'),
+        ])
+        self.assertEqual(builder.scanner.candidates("/"), 2)
+        self.assertEqual(builder.tokenize(text)[-1][3], 2)
+
+        with self.assertRaises(RuntimeError):
+            list(builder.scan("int a = 1 @ 2;"))
+
+    def test_sizeof(self):
+        # both C builders classify sizeof like any other keyword
+        text = "sizeof(int) + sizeofx"
+        layered = [(label, text[start:end]) for label, start, end in CLayeringLexerBuilder().scan(text)]
+        flat = [(label, text[start:end]) for label, start, end in CLexerBuilder().lexer.scan(text)
+                if label != "SPACE"]
+        self.assertEqual([token for token in layered if token[1] in ("sizeof", "int", "sizeofx")],
+                         [('KEYWORD_SIZEOF', 'sizeof'), ('KEYWORD_INT', 'int'), ('IDENTIFIER', 'sizeofx')])
+        self.assertEqual([token for token in flat if token[1] in ("sizeof", "int", "sizeofx")],
+                         [('KEYWORD', 'sizeof'), ('KEYWORD', 'int'), ('IDENTIFIER', 'sizeofx')])
+
+
+class TestAlphabetMerger(unittest.TestCase):
+    def test_merge(self):
+        groups, range_map = RegexLexer.parse_group(token_spec)
+        origin, nfa = RegexCompiler().compile_group(groups, range_map)
+        origin, dfa = N2DConvertor(nfa, origin).convert()
+        origin, dfa = DFAOptimizer(dfa, origin).optimize()
+        merged_origin, merged = AlphabetMerger(dfa, origin).merge()
+
+        self.assertEqual(merged_origin, origin)
+        self.assertEqual(len(merged.nodes), len(dfa.nodes))
+        self.assertLess(len(merged.alphabet), len(dfa.alphabet))
+        self.assertLess(len(merged.edges), len(dfa.edges))
+
+        for c in range(0, 200):
+            for state in dfa.nodes:
+                self.assertEqual(merged.translate_to(state, merged.range_map.search(c).meta),
+                                 dfa.translate_to(state, dfa.range_map.search(c).meta))
+
+
+class TestGlushkov(unittest.TestCase):
+    def test_epsilon_free(self):
+        groups, range_map = RegexLexer.parse_group(token_spec)
+        _, thompson = RegexCompiler().compile_group(groups, range_map)
+        _, glushkov = RegexCompiler(construction=RegexCompiler.Construction.GLUSHKOV).compile_group(groups, range_map)
+
+        self.assertFalse(any(symbol == EPSILON for _, symbol in glushkov.edges))
+        self.assertLess(len(glushkov.nodes), len(thompson.nodes))
+
+        tokens, range_map = RegexLexer.parse("(a|b)*abb")
+        origin, nfa, accepts = RegexCompiler().compile_positions(tokens, range_map)
+        self.assertEqual(accepts, {state for state, node_info in nfa.nodes.items() if node_info.accept})
+        self.assertNotIn(origin, accepts)
+        _, _, terminal = RegexCompiler(construction=RegexCompiler.Construction.GLUSHKOV).compile(tokens, range_map)
+        self.assertIsInstance(terminal, int)
+
+    def test_scan(self):
+        spec = token_spec + [('OTHER', '(a|b)*abb|x?y+(zz)*')]
+        expected = list(Lexer(spec).scan(source + "abbaabb yzz"))
+        for lazy in (False, True):
+            lexer = Lexer(spec, lazy=lazy, construction=RegexCompiler.Construction.GLUSHKOV)
+            self.assertEqual(list(lexer.scan(source + "abbaabb yzz")), expected)
+
+
+class TestDirectDFA(unittest.TestCase):
+    def test_compile_group_dfa(self):
+        groups, range_map = RegexLexer.parse_group(token_spec)
+        origin, direct = RegexCompiler().compile_group_dfa(groups, range_map)
+        nfa_origin, nfa = RegexCompiler(construction=RegexCompiler.Construction.GLUSHKOV).compile_group(groups, range_map)
+        _, subset = N2DConvertor(nfa, nfa_origin).convert()
+
+        self.assertEqual(origin, 0)
+        self.assertEqual(len(direct.nodes), len(subset.nodes))
+        self.assertEqual(len(direct.edges), len(subset.edges))
+
+    def test_scan(self):
+        spec = token_spec + [('OTHER', '(a|b)*abb|x?y+(zz)*|q*')]
+        text = source + "abbaabb yzz qq"
+        for minimization in (False, True):
+            expected = list(Lexer(spec, minimization=minimization).scan(text))
+            lexer = Lexer(spec, minimization=minimization, construction=RegexCompiler.Construction.DIRECT)
+            self.assertEqual(list(lexer.scan(text)), expected)
+
+
+class TestDFATrimmer(unittest.TestCase):
+    def test_trim(self):
+        dfa = DFA()
+        dfa.add_node(0)
+        dfa.add_node(1, accept=True, label="A")
+        dfa.add_node(2)                         # dead: no accept state after it
+        dfa.add_node(3)                         # dead loop
+        dfa.add_node(4, accept=True, label="B") # unreachable
+        dfa.add_edge(0, 1, 0)
+        dfa.add_edge(1, 2, 1)
+        dfa.add_edge(2, 3, 0)
+        dfa.add_edge(3, 3, 0)
+        dfa.add_edge(4, 1, 0)
+
+        origin, trimmed = DFATrimmer(dfa, 0).trim()
+        self.assertEqual(origin, 0)
+        self.assertEqual(set(trimmed.nodes), {0, 1})
+        self.assertEqual(trimmed.edges, {(0, 0): 1})
+
+        empty = DFA()
+        empty.add_node(0)
+        empty.add_node(1)
+        empty.add_edge(0, 1, 0)
+        self.assertEqual(set(DFATrimmer(empty, 0).trim()[1].nodes), {0})
+
+
+class TestNFAClosure(unittest.TestCase):
+    def test_closure(self):
+        rnd = random.Random(1)
+        for _ in range(100):
+            nfa = NFA()
+            size = rnd.randint(1, 30)
+            nfa.add_nodes(*range(size))
+            for _ in range(rnd.randint(0, size * 2)):
+                nfa.add_edge(rnd.randrange(size), rnd.randrange(size), rnd.choice([EPSILON, EPSILON, 1]))
+
+            for state in range(size):
+                expected, stack = set(), [state]
+                while stack:
+                    node = stack.pop()
+                    if node not in expected:
+                        expected.add(node)
+                        stack.extend(nfa.translate_to(node, EPSILON) or ())
+                self.assertEqual(nfa.closure({state}), expected)
+                self.assertEqual(nfa.closure_mask(state), sum(1 << nfa.state_index[node] for node in expected))
+
+            nfa.add_edge(0, size - 1)       # cache invalidated by ε edge
+            self.assertIn(size - 1, nfa.closure({0}))
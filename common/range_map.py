@@ -2,6 +2,14 @@
 # @author: anishan
 # @date: 2025/04/09
 # @description: range mapping, currently implemented by range AVL
+from array import array
+from bisect import bisect_right
+from typing import Iterable
+
+try:
+    import numpy as np
+except ImportError:         # optional, classification falls back to pure python
+    np = None
 
 class TreeRangeNode:
     """
@@ -85,6 +93,14 @@ class RangeMap:
         r_height = RangeMap.__get_height(root.right)
         root.height = max(l_height, r_height) + 1
 
+    @staticmethod
+    def __set_extent(root: TreeRangeNode):
+        """
+        min/max is the extent [min, max) of the whole subtree, trimming relies on it
+        """
+        root.min = root.beg if root.left is None else root.left.min
+        root.max = root.end if root.right is None else root.right.max
+
     @staticmethod
     def __left_rotate(x: TreeRangeNode) -> TreeRangeNode:
         """
@@ -102,10 +118,8 @@ class RangeMap:
         RangeMap.__set_height(x)
         RangeMap.__set_height(y)
 
-        x.max = RangeMap.__right_limit(x, x.right)
-        x.min = RangeMap.__left_limit(x, x.left)
-        y.max = RangeMap.__right_limit(y, y.right)
-        y.min = RangeMap.__left_limit(y, y.left)
+        RangeMap.__set_extent(x)
+        RangeMap.__set_extent(y)
 
         return y
 
@@ -126,10 +140,8 @@ class RangeMap:
         RangeMap.__set_height(x)
         RangeMap.__set_height(y)
 
-        x.max = RangeMap.__right_limit(x, x.right)
-        x.min = RangeMap.__left_limit(x, x.left)
-        y.max = RangeMap.__right_limit(y, y.right)
-        y.min = RangeMap.__left_limit(y, y.left)
+        RangeMap.__set_extent(x)
+        RangeMap.__set_extent(y)
 
         return y
 
@@ -163,7 +175,7 @@ class RangeMap:
 
         if left_height > right_height:  # L
             left_left_height = RangeMap.__get_height(RangeMap.__get_left(root.left))
-            left_right_height = RangeMap.__get_height(RangeMap.__get_right(root.right))
+            left_right_height = RangeMap.__get_height(RangeMap.__get_right(root.left))
 
             if left_left_height > left_right_height:  # LL
                 root = RangeMap.__right_rotate(root)
@@ -188,7 +200,7 @@ class RangeMap:
 
         root.beg = RangeMap.__left_limit(root, root.left)
         root.end = RangeMap.__right_limit(root, root.right)
-
+        RangeMap.__set_extent(root)
 
         root.height = max(left_height, right_height) + 1
 
@@ -274,6 +286,206 @@ class RangeMap:
 
         return root
 
+    @staticmethod
+    def __build_balanced(boundaries: list[int], metas: list, lo: int, hi: int) -> TreeRangeNode | None:
+        """
+        perfectly balanced subtree of ranges [boundaries[i], boundaries[i + 1]) for i in [lo, hi)
+        """
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        root = TreeRangeNode(boundaries[mid], boundaries[mid + 1])
+        root.meta = metas[mid]
+        root.left = RangeMap.__build_balanced(boundaries, metas, lo, mid)
+        root.right = RangeMap.__build_balanced(boundaries, metas, mid + 1, hi)
+        RangeMap.__set_height(root)
+        RangeMap.__set_extent(root)
+        return root
+
+    @staticmethod
+    def from_boundaries(boundaries: Iterable[int | str], metas: Iterable | None = None,
+                        enable_merge: bool = False) -> 'RangeMap':
+        """
+        bulk build from cut points, same ranges as inserting [b_i, b_i+1) one by one, in O(k log k):
+        cut points are sorted and deduplicated once, the tree is built balanced without any rotation
+        :param boundaries: cut points, the map covers [min, max)
+        :param metas: meta of each range in order, defaults to range index
+        """
+        cuts = sorted({ord(cut) if isinstance(cut, str) else cut for cut in boundaries})
+        count = max(0, len(cuts) - 1)
+        metas = list(range(count)) if metas is None else list(metas)
+        if len(metas) != count:
+            raise ValueError(f"Expected {count} metas, got {len(metas)}")
+
+        range_map = RangeMap(enable_merge)
+        range_map.__root = RangeMap.__build_balanced(cuts, metas, 0, count)
+        return range_map
+
     def dfs(self, dlr_handler = None, ldr_handler = None, lrd_handler = None):
         RangeMap.__dlr(self.__root, dlr_handler, ldr_handler, lrd_handler)
 
+    def freeze(self) -> 'FrozenRangeMap':
+        """
+        snapshot current ranges into a read-only lookup structure,
+        later insertion won't affect the snapshot
+        """
+        ranges = []
+        self.dfs(ldr_handler=lambda node, *_: ranges.append((node.beg, node.end, node.meta)))
+        return FrozenRangeMap(ranges)
+
+
+class FrozenRangeMap:
+    """
+    read-only range mapping for lookups after the range map is built,
+    ranges are flattened into two array('I') columns: boundaries (start of each segment, sorted) and class ids,
+    gaps between ranges are segments of class UNCOVERED, so a lookup is a single bisect_right, a few bytes per range.
+    code points below DIRECT_SIZE are classified by a direct-index table first
+    """
+    DIRECT_SIZE = 256
+    MISSING = -1
+    UNCOVERED = 0xFFFFFFFF          # class id of gap segments in the 'I' column
+    NUMPY_THRESHOLD = 4096          # buffers from this length are classified by numpy when it is installed
+
+    __slots__ = ('__boundaries', '__classes', '__direct', '__latin1_table', '__count', '__numpy_columns')
+
+    def __init__(self, ranges: list[tuple[int, int, int]]):
+        """
+        :param ranges: sorted, non-overlapping [beg, end) ranges with their meta(non-negative int, None if unset)
+        """
+        boundaries, classes = array('I', [0]), array('I', [FrozenRangeMap.UNCOVERED])
+        for beg, end, meta in ranges:
+            cls = FrozenRangeMap.UNCOVERED if meta is None else meta
+            if beg < boundaries[-1] or beg >= end:
+                raise ValueError(f"Overlapped or unsorted range [{beg}, {end})")
+            if boundaries[-1] == beg:       # range starts where the last gap does, the gap is empty
+                classes[-1] = cls
+            else:
+                boundaries.append(beg)
+                classes.append(cls)
+            boundaries.append(end)
+            classes.append(FrozenRangeMap.UNCOVERED)
+
+        direct = array('i', [FrozenRangeMap.MISSING]) * FrozenRangeMap.DIRECT_SIZE
+        for beg, end, meta in ranges:
+            if beg >= FrozenRangeMap.DIRECT_SIZE:
+                break
+            for c in range(beg, min(end, FrozenRangeMap.DIRECT_SIZE)):
+                direct[c] = FrozenRangeMap.MISSING if meta is None else meta
+
+        self.__boundaries = boundaries
+        self.__classes = classes
+        self.__direct = direct
+        self.__count = sum(meta is not None for _, _, meta in ranges)
+
+        # latin-1 text -> class ids in one bytes.translate, only when every class fits in a byte (255 is MISSING)
+        if all(-1 <= cls < 255 for cls in direct):
+            self.__latin1_table = bytes(255 if cls < 0 else cls for cls in direct)
+        else:
+            self.__latin1_table = None
+        self.__numpy_columns = None
+
+    @property
+    def direct(self) -> array:
+        """
+        direct-index table, direct[c] is meta of code point c (c < DIRECT_SIZE), MISSING if not covered
+        """
+        return self.__direct
+
+    @property
+    def boundaries(self) -> memoryview:
+        """
+        read-only start of each segment
+        """
+        return memoryview(self.__boundaries).toreadonly()
+
+    @property
+    def classes(self) -> memoryview:
+        """
+        read-only class id of each segment, UNCOVERED for gaps
+        """
+        return memoryview(self.__classes).toreadonly()
+
+    def __len__(self):
+        return self.__count
+
+    def lookup(self, ele: int | str):
+        """
+        :return: meta of the range containing ele, None if not covered
+        """
+        ele = ele if isinstance(ele, int) else ord(ele)
+        if ele < FrozenRangeMap.DIRECT_SIZE:
+            meta = self.__direct[ele]
+            return None if meta == FrozenRangeMap.MISSING else meta
+
+        cls = self.__classes[bisect_right(self.__boundaries, ele) - 1]
+        return None if cls == FrozenRangeMap.UNCOVERED else cls
+
+    def __get_numpy_columns(self):
+        """
+        numpy views of the columns, gaps are MISSING in the class column
+        """
+        if self.__numpy_columns is None:
+            classes = np.frombuffer(self.__classes, dtype=np.uint32).astype(np.int32)   # UNCOVERED wraps to -1
+            self.__numpy_columns = (np.frombuffer(self.__boundaries, dtype=np.uint32), classes,
+                                    np.frombuffer(self.__direct, dtype=np.int32))
+        return self.__numpy_columns
+
+    def classify_numpy(self, buffer) -> 'np.ndarray':
+        """
+        classify a whole buffer in one shot with numpy:
+        direct table indexing if every code point is below DIRECT_SIZE, searchsorted over boundaries otherwise
+        :param buffer: text (read as utf-32), bytes (one code point per byte) or an array of code points
+        :return: int32 ndarray of class ids, MISSING for characters not covered
+        """
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+
+        if isinstance(buffer, str):
+            points = np.frombuffer(buffer.encode("utf-32-le"), dtype="<u4")
+        elif isinstance(buffer, (bytes, bytearray, memoryview)):
+            points = np.frombuffer(buffer, dtype=np.uint8)
+        else:
+            points = np.asarray(buffer, dtype=np.uint32)
+
+        boundaries, classes, direct = self.__get_numpy_columns()
+        if not len(points) or points.max() < FrozenRangeMap.DIRECT_SIZE:
+            return direct[points]
+        return classes[np.searchsorted(boundaries, points, side="right") - 1]
+
+    def classify(self, buffer: str | Iterable[int]) -> array:
+        """
+        classify a whole buffer at once, by numpy for long buffers if it is installed
+        :param buffer: text, or code points (array('I'), bytes of ascii ...)
+        :return: array('i') of class ids, MISSING for characters not covered
+        """
+        if np is not None and isinstance(buffer, (str, bytes, bytearray, array)) \
+                and len(buffer) >= FrozenRangeMap.NUMPY_THRESHOLD:
+            result = array('i')
+            result.frombytes(self.classify_numpy(buffer).astype(np.int32, copy=False).tobytes())
+            return result
+
+        if isinstance(buffer, str):
+            table = self.__latin1_table
+            if table is not None:
+                try:
+                    translated = buffer.encode("latin-1").translate(table)
+                except UnicodeEncodeError:
+                    pass
+                else:
+                    classes = array('i', memoryview(translated))     # bytes would be read as raw ints
+                    if 255 in translated:
+                        classes = array('i', (FrozenRangeMap.MISSING if cls == 255 else cls for cls in classes))
+                    return classes
+            buffer = map(ord, buffer)
+
+        direct, direct_size = self.__direct, FrozenRangeMap.DIRECT_SIZE
+        boundaries, classes, uncovered = self.__boundaries, self.__classes, FrozenRangeMap.UNCOVERED
+        result = array('i')
+        append = result.append
+        for c in buffer:
+            if c < direct_size:
+                append(direct[c])
+            else:
+                cls = classes[bisect_right(boundaries, c) - 1]
+                append(FrozenRangeMap.MISSING if cls == uncovered else cls)
+        return result
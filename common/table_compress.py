@@ -0,0 +1,216 @@
+from array import array
+from collections import Counter
+from collections.abc import Hashable
+from typing import Any, Callable, Iterable, Sequence
+
+MISSING = -1        # value id of an absent entry
+_ABSENT = object()
+
+
+def _typecode(limit: int) -> str:
+    """
+    smallest signed array typecode holding -1..limit
+    """
+    for typecode in ('b', 'h', 'i'):
+        if limit < 1 << (8 * array(typecode).itemsize - 1):
+            return typecode
+    return 'q'
+
+
+class CombTable:
+    """
+    Sparse 2d table compressed by row displacement (comb vector, the yacc/lex triple array).
+    Every row keeps only the entries different from its default value, rows are slid over each other (first fit)
+    into one shared next/check vector, a row owns slot base[row] + col when check[slot] == row.
+    - lookup(row, col): slot = base[row] + col; next[slot] if check[slot] == row else default[row]
+    Row and column keys are any hashable (DFA states and symbols, LR states and parse tokens), they get dense ids,
+    values are interned into a value pool, next/default hold value ids, MISSING(-1) for an absent entry.
+    The vector is padded by one row width so a lookup needs no bound check,
+    every vector uses the smallest integer type holding its ids.
+    """
+
+    def __init__(self, rows: Sequence[Hashable], columns: Sequence[Hashable], values: Sequence[Any],
+                 entries: Sequence[dict[int, int]], reducible: Callable[[Any], bool] | None = None):
+        """
+        :param rows: row keys, row id is the position
+        :param columns: column keys, column id is the position
+        :param values: value pool
+        :param entries: row id -> {column id: value id}, absent columns are MISSING
+        :param reducible: values allowed to stand for the absent entries of their row (default reductions),
+                          a row with such a value defaults to its most common one and absent entries are dropped,
+                          lookups of them return it instead of MISSING. None keeps the table exact
+        """
+        self.__row_index = {row: idx for idx, row in enumerate(rows)}
+        self.__column_index = {column: idx for idx, column in enumerate(columns)}
+        self.__values = tuple(values)
+        column_count = len(columns)
+
+        reducible_ids = [reducible(value) for value in self.__values] if reducible is not None else None
+        defaults = array('i', [MISSING]) * len(entries)
+        rows_entries: list[list[tuple[int, int]]] = []
+        for row_id, row in enumerate(entries):
+            default = defaults[row_id] = CombTable.__row_default(row, column_count, reducible_ids)
+            kept = [(col, vid) for col, vid in row.items() if vid != default]
+            if default != MISSING and not (reducible_ids and reducible_ids[default]):
+                # exact default, absent entries have to be stored as MISSING
+                kept.extend((col, MISSING) for col in range(column_count) if col not in row)
+            rows_entries.append(sorted(kept))
+
+        self.__defaults = array(_typecode(len(self.__values)), defaults)
+        self.__base, self.__next, self.__check = CombTable.__pack(rows_entries, column_count)
+        self.__column_count = column_count
+
+    @staticmethod
+    def __row_default(row: dict[int, int], column_count: int, reducible: list[bool] | None) -> int:
+        counts = Counter(row.values())
+        if reducible:
+            candidates = [(count, vid) for vid, count in counts.items() if reducible[vid]]
+            if candidates:
+                return max(candidates)[1]
+
+        counts[MISSING] += column_count - len(row)
+        return max(counts.items(), key=lambda item: (item[1], item[0] == MISSING))[0]
+
+    @staticmethod
+    def __pack(rows_entries: list[list[tuple[int, int]]], column_count: int) -> tuple[array, array, array]:
+        """
+        first fit, the densest rows first
+        """
+        base = array('i', [0]) * len(rows_entries)
+        check: list[int] = []
+        next_: list[int] = []
+        lowest_free = 0
+
+        for row_id in sorted(range(len(rows_entries)), key=lambda idx: -len(rows_entries[idx])):
+            row = rows_entries[row_id]
+            if not row:
+                continue
+            first_col = row[0][0]
+            offset = max(0, lowest_free - first_col)
+            while any(offset + col < len(check) and check[offset + col] >= 0 for col, _ in row):
+                offset += 1
+
+            last = offset + row[-1][0]
+            if last >= len(check):
+                grow = last + 1 - len(check)
+                check.extend([-1] * grow)
+                next_.extend([MISSING] * grow)
+            for col, vid in row:
+                check[offset + col] = row_id
+                next_[offset + col] = vid
+            base[row_id] = offset
+
+            while lowest_free < len(check) and check[lowest_free] >= 0:
+                lowest_free += 1
+
+        # padding, base + col is always a valid slot
+        size = max(base, default=0) + column_count
+        if size > len(check):
+            check.extend([-1] * (size - len(check)))
+            next_.extend([MISSING] * (size - len(next_)))
+        return (array(_typecode(len(check)), base), array(_typecode(max(next_, default=0)), next_),
+                array(_typecode(len(rows_entries)), check))
+
+    @staticmethod
+    def from_mapping(mapping: dict[tuple[Hashable, Hashable], Any],
+                     reducible: Callable[[Any], bool] | None = None) -> 'CombTable':
+        """
+        :param mapping: (row, column) -> value, e.g. DFA.edges or LR1Parser.action_goto_table
+        """
+        rows = list(dict.fromkeys(row for row, _ in mapping))
+        columns = list(dict.fromkeys(column for _, column in mapping))
+        return CombTable.__from_items(rows, columns, mapping.items(), reducible)
+
+    @staticmethod
+    def from_dense(table: Sequence[int], column_count: int, missing: int = MISSING) -> 'CombTable':
+        """
+        :param table: row major `rows × column_count` matrix of non-negative ints(DFATable.transitions),
+                      rows and columns are their ids, values are their own value ids so lookup returns them directly
+        :param missing: value of an absent entry(DFATable.DEAD)
+        """
+        row_count = len(table) // column_count if column_count else 0
+        entries: list[dict[int, int]] = [{} for _ in range(row_count)]
+        for idx, value in enumerate(table):
+            if value != missing:
+                row, col = divmod(idx, column_count)
+                entries[row][col] = value
+        values = range(max((value for value in table if value != missing), default=-1) + 1)
+        return CombTable(range(row_count), range(column_count), values, entries)
+
+    @staticmethod
+    def __from_items(rows: Sequence[Hashable], columns: Sequence[Hashable],
+                     items: Iterable[tuple[tuple[Hashable, Hashable], Any]],
+                     reducible: Callable[[Any], bool] | None) -> 'CombTable':
+        row_index = {row: idx for idx, row in enumerate(rows)}
+        column_index = {column: idx for idx, column in enumerate(columns)}
+        values: list[Any] = []
+        value_index: dict[Any, int] = {}
+        entries: list[dict[int, int]] = [{} for _ in rows]
+        for (row, column), value in items:
+            if value not in value_index:
+                value_index[value] = len(values)
+                values.append(value)
+            entries[row_index[row]][column_index[column]] = value_index[value]
+        return CombTable(rows, columns, values, entries, reducible)
+
+    @property
+    def row_count(self) -> int:
+        return len(self.__base)
+
+    @property
+    def column_count(self) -> int:
+        return self.__column_count
+
+    @property
+    def values(self) -> tuple[Any, ...]:
+        return self.__values
+
+    @property
+    def nbytes(self) -> int:
+        """
+        bytes of the base/next/check/default vectors
+        """
+        return sum(len(vector) * vector.itemsize
+                   for vector in (self.__base, self.__next, self.__check, self.__defaults))
+
+    @property
+    def dense_nbytes(self) -> int:
+        """
+        bytes of the same table as a dense `rows × columns` int matrix(array('i'))
+        """
+        return self.row_count * self.__column_count * array('i').itemsize
+
+    def lookup(self, row: int, column: int) -> int:
+        """
+        :param row: row id
+        :param column: column id
+        :return: value id, MISSING if there is no entry
+        """
+        slot = self.__base[row] + column
+        if self.__check[slot] == row:
+            return self.__next[slot]
+        return self.__defaults[row]
+
+    def get(self, row: Hashable, column: Hashable, default: Any = None) -> Any:
+        """
+        value of (row, column) by keys, default if there is no entry
+        """
+        row = self.__row_index.get(row)
+        if row is None:
+            return default
+        column = self.__column_index.get(column)
+        if column is None:
+            vid = self.__defaults[row]
+        else:
+            slot = self.__base[row] + column
+            vid = self.__next[slot] if self.__check[slot] == row else self.__defaults[row]
+        return default if vid == MISSING else self.__values[vid]
+
+    def __getitem__(self, key: tuple[Hashable, Hashable]) -> Any:
+        value = self.get(key[0], key[1], _ABSENT)
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: tuple[Hashable, Hashable]) -> bool:
+        return self.get(key[0], key[1], _ABSENT) is not _ABSENT
@@ -0,0 +1,212 @@
+from array import array
+from collections.abc import Sequence
+from typing import Any, Iterator
+
+Token = tuple[Any, int, int, int]
+
+
+class LabelView(Sequence):
+    """
+    read-only sequence of token labels, parsers can index it like a token string
+    """
+
+    def __init__(self, buffer: 'TokenBuffer'):
+        self.__buffer = buffer
+
+    def __len__(self):
+        return len(self.__buffer)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return LabelView(self.__buffer[idx])
+        return self.__buffer.label(idx)
+
+
+class TokenBuffer:
+    """
+    Struct of arrays token storage, column i of every array is token i:
+    - kinds: label index (labels[kind] is the label)
+    - starts/ends: [start, end) offsets into the source
+    - lines: line number(0 based) of token start
+    slicing gives a view sharing the same columns, views are read only
+    """
+
+    def __init__(self, labels: Sequence[Any] = ()):
+        """
+        :param labels: known labels, unknown labels are registered on append
+        """
+        self.__labels: list[Any] = []
+        self.__label_index: dict[Any, int] = {}
+        for label in labels:
+            self.kind_of(label)
+
+        self.__kinds = array('i')
+        self.__starts = array('i')
+        self.__ends = array('i')
+        self.__lines = array('i')
+
+        self.__begin = 0                # view window [begin, end), end None means whole columns
+        self.__end: int | None = None
+
+    @staticmethod
+    def from_columns(labels: Sequence[Any], kinds: array, starts: array, ends: array, lines: array) -> 'TokenBuffer':
+        """
+        buffer owning already filled columns (array('i') of the same length), kinds index labels
+        """
+        if not len(kinds) == len(starts) == len(ends) == len(lines):
+            raise ValueError("Token columns have different lengths")
+        buffer = TokenBuffer(labels)
+        buffer.__kinds, buffer.__starts, buffer.__ends, buffer.__lines = kinds, starts, ends, lines
+        return buffer
+
+    def __view(self, begin: int, end: int) -> 'TokenBuffer':
+        view = TokenBuffer.__new__(TokenBuffer)
+        view.__labels, view.__label_index = self.__labels, self.__label_index
+        view.__kinds, view.__starts, view.__ends, view.__lines = self.__kinds, self.__starts, self.__ends, self.__lines
+        view.__begin, view.__end = begin, end
+        return view
+
+    @property
+    def is_view(self) -> bool:
+        return self.__end is not None
+
+    @property
+    def labels(self) -> Sequence[Any]:
+        return self.__labels
+
+    def kind_of(self, label: Any) -> int:
+        """
+        label -> label index, register it if unknown
+        """
+        kind = self.__label_index.get(label)
+        if kind is None:
+            kind = self.__label_index[label] = len(self.__labels)
+            self.__labels.append(label)
+        return kind
+
+    def __bounds(self) -> tuple[int, int]:
+        return self.__begin, len(self.__kinds) if self.__end is None else self.__end
+
+    def __len__(self):
+        begin, end = self.__bounds()
+        return end - begin
+
+    def __index(self, idx: int) -> int:
+        begin, end = self.__bounds()
+        if idx < 0:
+            idx += end - begin
+        if not 0 <= idx < end - begin:
+            raise IndexError("token index out of range")
+        return begin + idx
+
+    def append(self, label: Any, start: int, end: int, line: int = 0) -> None:
+        self.append_kind(self.kind_of(label), start, end, line)
+
+    def append_kind(self, kind: int, start: int, end: int, line: int = 0) -> None:
+        """
+        fast path, kind is already a label index
+        """
+        if self.is_view:
+            raise RuntimeError("Token buffer view is read only")
+        self.__kinds.append(kind)
+        self.__starts.append(start)
+        self.__ends.append(end)
+        self.__lines.append(line)
+
+    def splice(self, begin: int, end: int, tokens: 'TokenBuffer') -> None:
+        """
+        replace tokens [begin, end) by tokens
+        """
+        if self.is_view:
+            raise RuntimeError("Token buffer view is read only")
+        if not 0 <= begin <= end <= len(self):
+            raise IndexError("token range out of range")
+
+        remap = [self.kind_of(label) for label in tokens.__labels]
+        other_begin, other_end = tokens.__bounds()
+        self.__kinds[begin:end] = array('i', map(remap.__getitem__, tokens.__kinds[other_begin:other_end]))
+        self.__starts[begin:end] = tokens.__starts[other_begin:other_end]
+        self.__ends[begin:end] = tokens.__ends[other_begin:other_end]
+        self.__lines[begin:end] = tokens.__lines[other_begin:other_end]
+
+    def shift(self, begin: int, end: int, delta: int, line_delta: int = 0) -> None:
+        """
+        move tokens [begin, end) by delta characters and line_delta lines
+        """
+        if self.is_view:
+            raise RuntimeError("Token buffer view is read only")
+        if delta:
+            self.__starts[begin:end] = array('i', map(delta.__add__, self.__starts[begin:end]))
+            self.__ends[begin:end] = array('i', map(delta.__add__, self.__ends[begin:end]))
+        if line_delta:
+            self.__lines[begin:end] = array('i', map(line_delta.__add__, self.__lines[begin:end]))
+
+    def __column(self, column: array) -> memoryview:
+        begin, end = self.__bounds()
+        return memoryview(column)[begin:end]
+
+    @property
+    def kinds(self) -> memoryview:
+        """
+        zero copy column view, release it before appending (array can't resize while exported)
+        """
+        return self.__column(self.__kinds)
+
+    @property
+    def starts(self) -> memoryview:
+        return self.__column(self.__starts)
+
+    @property
+    def ends(self) -> memoryview:
+        return self.__column(self.__ends)
+
+    @property
+    def lines(self) -> memoryview:
+        return self.__column(self.__lines)
+
+    def label(self, idx: int) -> Any:
+        return self.__labels[self.__kinds[self.__index(idx)]]
+
+    def label_view(self) -> LabelView:
+        return LabelView(self)
+
+    def lexeme(self, text: str, idx: int) -> str:
+        """
+        materialize token idx from its source text
+        """
+        i = self.__index(idx)
+        return text[self.__starts[i]:self.__ends[i]]
+
+    def __getitem__(self, idx: int | slice) -> 'Token | TokenBuffer':
+        """
+        :return: (label, start, end, line), or a view for slice
+        """
+        if isinstance(idx, slice):
+            begin, end = self.__bounds()
+            start, stop, step = idx.indices(end - begin)
+            if step != 1:
+                raise ValueError("Token buffer view only supports step 1")
+            return self.__view(begin + start, begin + max(start, stop))
+
+        i = self.__index(idx)
+        return self.__labels[self.__kinds[i]], self.__starts[i], self.__ends[i], self.__lines[i]
+
+    def __iter__(self) -> Iterator[Token]:
+        begin, end = self.__bounds()
+        labels = self.__labels
+        kinds, starts, ends, lines = self.__kinds, self.__starts, self.__ends, self.__lines
+        for i in range(begin, end):
+            yield labels[kinds[i]], starts[i], ends[i], lines[i]
+
+    def __repr__(self):
+        return f"TokenBuffer({len(self)} tokens)"
+
+    def __getstate__(self):
+        begin, end = self.__bounds()
+        return (self.__labels, self.__kinds[begin:end], self.__starts[begin:end],
+                self.__ends[begin:end], self.__lines[begin:end])
+
+    def __setstate__(self, state):
+        self.__labels, self.__kinds, self.__starts, self.__ends, self.__lines = state
+        self.__label_index = {label: idx for idx, label in enumerate(self.__labels)}
+        self.__begin, self.__end = 0, None
@@ -0,0 +1,333 @@
+import ast
+import hashlib
+import importlib.util
+import os
+import sys
+from types import ModuleType
+from typing import Any, Sequence
+
+from lex.dfa import DFA
+from lex.scan_engine import ScanEngine
+
+MAX_CODE_POINT = 0x110000     # exclusive end of the unicode range
+GENERATED_MODULE_PREFIX = "_lex_generated_"
+
+
+class ScannerEmitter:
+    """
+    DFA -> python source of a scanner module.
+    Every state is a branch of a binary dispatch on the state number, its transitions are inlined range tests on
+    the code point, self loops become tight while loops, and states with many tests dispatch ascii through a tuple.
+    The module has no tables to interpret, it exposes the ScanEngine interface as functions:
+    ORIGIN, LABELS, advance(text, pos, state), advance_bytes(data, pos, state), scan(text, pos), scan_bytes(data, pos)
+    """
+    ASCII_SIZE = 128
+    TABLE_THRESHOLD = 4     # states with more range tests than this use an ascii jump table
+
+    def __init__(self, dfa: DFA, origin: int):
+        if dfa.range_map is None:
+            raise RuntimeError("DFA without range map can't be emitted")
+
+        state_index = {state: idx for idx, state in enumerate(dfa.nodes)}   # dense state id
+
+        class_ranges: dict[int, list[tuple[int, int]]] = {}
+        dfa.range_map.dfs(ldr_handler=lambda node, *_: class_ranges.setdefault(node.meta, []).append((node.beg, node.end)))
+
+        # state -> {dest: [beg, end) ranges}
+        moves: list[dict[int, list[tuple[int, int]]]] = [{} for _ in state_index]
+        for (state, symbol), dest in dfa.edges.items():
+            moves[state_index[state]].setdefault(state_index[dest], []).extend(class_ranges.get(symbol, ()))
+        self.__moves = [{dest: self.__merge(ranges) for dest, ranges in move.items()} for move in moves]
+
+        self.__labels: list[Any] = []
+        label_index = {}
+        self.__accepts = [ScanEngine.NO_LABEL] * len(state_index)
+        for state, node_info in dfa.nodes.items():
+            if not node_info.accept:
+                continue
+            if node_info.label not in label_index:
+                label_index[node_info.label] = len(self.__labels)
+                self.__labels.append(node_info.label)
+            self.__accepts[state_index[state]] = label_index[node_info.label]
+
+        for label in self.__labels:
+            try:
+                valid = ast.literal_eval(repr(label)) == label
+            except (ValueError, SyntaxError):
+                valid = False
+            if not valid:
+                raise RuntimeError(f"Label {label!r} can't be emitted as a literal")
+
+        self.__origin = state_index[origin]
+        self.__lines: list[str] = []
+
+    @staticmethod
+    def __merge(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        merged = []
+        for beg, end in sorted(ranges):
+            if merged and merged[-1][1] >= beg:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((beg, end))
+        return merged
+
+    @staticmethod
+    def __condition(ranges: list[tuple[int, int]]) -> str:
+        tests = []
+        for beg, end in ranges:
+            if end - beg == 1:
+                tests.append(f"c == {beg}")
+            elif beg == 0:
+                tests.append(f"c < {end}")
+            elif end >= MAX_CODE_POINT:
+                tests.append(f"c >= {beg}")
+            else:
+                tests.append(f"{beg} <= c < {end}")
+        return " or ".join(tests) if tests else "False"
+
+    @staticmethod
+    def __clip(ranges: list[tuple[int, int]], low: int) -> list[tuple[int, int]]:
+        return [(max(beg, low), end) for beg, end in ranges if end > low]
+
+    def __emit(self, indent: int = 0, line: str = ""):
+        self.__lines.append("    " * indent + line if line else "")
+
+    def __uses_table(self, state: int) -> bool:
+        return sum(len(ranges) for dest, ranges in self.__moves[state].items() if dest != state) > self.TABLE_THRESHOLD
+
+    def __emit_read(self, indent: int, binary: bool):
+        if binary:
+            self.__emit(indent, "c = data[pos]")
+            self.__emit(indent, "if c < 128:")
+            self.__emit(indent + 1, "width = 1")
+            self.__emit(indent, "else:")
+            self.__emit(indent + 1, "c, width = decode_utf8(data, pos)")
+        else:
+            self.__emit(indent, "c = ord(text[pos])")
+
+    def __emit_step(self, indent: int, binary: bool):
+        self.__emit(indent, "pos += width" if binary else "pos += 1")
+
+    def __emit_transitions(self, indent: int, moves: dict[int, list[tuple[int, int]]], binary: bool):
+        """
+        c is read, go to the next state or stop
+        """
+        dead = f"return {ScanEngine.DEAD}, pos, last_label, last_end"
+        keyword = "if"
+        for dest, ranges in moves.items():
+            self.__emit(indent, f"{keyword} {self.__condition(ranges)}:")
+            self.__emit(indent + 1, f"state = {dest}")
+            self.__emit_step(indent + 1, binary)
+            if self.__accepts[dest] >= 0:
+                self.__emit(indent + 1, f"last_label = {self.__accepts[dest]}")
+                self.__emit(indent + 1, "last_end = pos")
+            keyword = "elif"
+
+        if keyword == "if":
+            self.__emit(indent, dead)
+        else:
+            self.__emit(indent, "else:")
+            self.__emit(indent + 1, dead)
+
+    def __emit_state(self, indent: int, state: int, binary: bool):
+        self.__emit(indent, f"# state {state}")
+        moves = {dest: ranges for dest, ranges in self.__moves[state].items() if dest != state}
+        loop = self.__moves[state].get(state)
+        label = self.__accepts[state]
+        alive = f"return {state}, pos, last_label, last_end"
+
+        if loop:
+            if label >= 0:
+                self.__emit(indent, "start = pos")
+            self.__emit(indent, "while pos < length:")
+            self.__emit_read(indent + 1, binary)
+            self.__emit(indent + 1, f"if not ({self.__condition(loop)}):")
+            self.__emit(indent + 2, "break")
+            self.__emit_step(indent + 1, binary)
+            self.__emit(indent, "else:")
+            if label >= 0:
+                self.__emit(indent + 1, "if pos != start:")
+                self.__emit(indent + 2, f"last_label = {label}")
+                self.__emit(indent + 2, "last_end = pos")
+            self.__emit(indent + 1, alive)
+            if label >= 0:
+                self.__emit(indent, "if pos != start:")
+                self.__emit(indent + 1, f"last_label = {label}")
+                self.__emit(indent + 1, "last_end = pos")
+        else:
+            self.__emit(indent, "if pos >= length:")
+            self.__emit(indent + 1, alive)
+            self.__emit_read(indent, binary)
+
+        if not self.__uses_table(state):
+            self.__emit_transitions(indent, moves, binary)
+            return
+
+        # ascii through the jump table, the rest by range tests
+        self.__emit(indent, f"if c < {self.ASCII_SIZE}:")
+        self.__emit(indent + 1, f"state = _ASCII_{state}[c]")
+        self.__emit(indent + 1, "if state < 0:")
+        self.__emit(indent + 2, f"return {ScanEngine.DEAD}, pos, last_label, last_end")
+        self.__emit_step(indent + 1, binary)
+        self.__emit(indent + 1, "if ACCEPTS[state] >= 0:")
+        self.__emit(indent + 2, "last_label = ACCEPTS[state]")
+        self.__emit(indent + 2, "last_end = pos")
+        self.__emit(indent, "else:")
+        wide = {dest: self.__clip(ranges, self.ASCII_SIZE) for dest, ranges in moves.items()}
+        self.__emit_transitions(indent + 1, {dest: ranges for dest, ranges in wide.items() if ranges}, binary)
+
+    def __emit_dispatch(self, indent: int, lo: int, hi: int, binary: bool):
+        """
+        binary search on state number over [lo, hi)
+        """
+        if hi - lo == 1:
+            self.__emit_state(indent, lo, binary)
+            return
+        mid = (lo + hi) // 2
+        self.__emit(indent, f"if state < {mid}:")
+        self.__emit_dispatch(indent + 1, lo, mid, binary)
+        self.__emit(indent, "else:")
+        self.__emit_dispatch(indent + 1, mid, hi, binary)
+
+    def __emit_advance(self, binary: bool):
+        source = "data" if binary else "text"
+        name = "advance_bytes" if binary else "advance"
+        self.__emit(0, f"def {name}({source}, pos, state):")
+        self.__emit(1, f"length = len({source})")
+        self.__emit(1, f"last_label = {ScanEngine.NO_LABEL}")
+        self.__emit(1, "last_end = pos")
+        self.__emit(1, "while True:")
+        self.__emit_dispatch(2, 0, len(self.__accepts), binary)
+        self.__emit()
+        self.__emit()
+
+    def __ascii_table(self, state: int) -> tuple[int, ...]:
+        table = [ScanEngine.DEAD] * self.ASCII_SIZE
+        for dest, ranges in self.__moves[state].items():
+            for beg, end in ranges:
+                for c in range(beg, min(end, self.ASCII_SIZE)):
+                    table[c] = dest
+        return tuple(table)
+
+    def emit(self) -> str:
+        """
+        :return: python source of the scanner module
+        """
+        self.__lines = []
+        self.__emit(0, "# generated by lex.codegen.ScannerEmitter, do not edit")
+        self.__emit(0, "from lex.scan_engine import decode_utf8")
+        self.__emit()
+        self.__emit(0, f"ORIGIN = {self.__origin}")
+        self.__emit(0, f"LABELS = {tuple(self.__labels)!r}")
+        self.__emit(0, f"ACCEPTS = {tuple(self.__accepts)!r}")
+        for state in range(len(self.__accepts)):
+            if self.__uses_table(state):
+                self.__emit(0, f"_ASCII_{state} = {self.__ascii_table(state)!r}")
+        self.__emit()
+        self.__emit()
+        self.__emit_advance(False)
+        self.__emit_advance(True)
+        self.__lines.append(_SCAN_TEMPLATE)
+        return "\n".join(self.__lines)
+
+    def write(self, path: str) -> None:
+        """
+        write the scanner module, importing it caches the bytecode as usual
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.emit())
+
+
+_SCAN_TEMPLATE = '''def scan(text, pos=0):
+    length = len(text)
+    while pos < length:
+        _, _, last_label, last_end = advance(text, pos, ORIGIN)
+        if last_label < 0:
+            raise RuntimeError(f"Unexpected character {text[pos]!r} at position {pos}")
+        yield LABELS[last_label], pos, last_end
+        pos = last_end
+
+
+def scan_bytes(data, pos=0):
+    length = len(data)
+    while pos < length:
+        _, _, last_label, last_end = advance_bytes(data, pos, ORIGIN)
+        if last_label < 0:
+            raise RuntimeError(f"Unexpected byte {data[pos]:#x} at position {pos}")
+        yield LABELS[last_label], pos, last_end
+        pos = last_end
+'''
+
+
+class GeneratedScanner(ScanEngine):
+    """
+    ScanEngine over a generated scanner module, so it can be used wherever DFATable is
+    """
+
+    def __init__(self, module: ModuleType):
+        self.__module = module
+        # bind module functions directly, skip one call level in the scan loops
+        self.advance = module.advance
+        self.advance_bytes = module.advance_bytes
+
+    @property
+    def module(self) -> ModuleType:
+        return self.__module
+
+    @property
+    def origin(self) -> int:
+        return self.__module.ORIGIN
+
+    @property
+    def labels(self) -> Sequence[Any]:
+        return self.__module.LABELS
+
+    @property
+    def state_count(self) -> int:
+        return len(self.__module.ACCEPTS)
+
+    def advance(self, text: str, pos: int, state: int) -> tuple[int, int, int, int]:
+        return self.__module.advance(text, pos, state)
+
+    def advance_bytes(self, data, pos: int, state: int) -> tuple[int, int, int, int]:
+        return self.__module.advance_bytes(data, pos, state)
+
+    def __reduce__(self):
+        return load_scanner, (self.__module.__file__, self.__module.__name__)
+
+
+def scanner_module_name(path: str) -> str:
+    """
+    unique module name of a generated scanner file: prefix + file name + hash of the absolute path,
+    two files of the same name in different directories never replace each other, or shadow a real module
+    """
+    path = os.path.abspath(path)
+    digest = hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{GENERATED_MODULE_PREFIX}{stem if stem.isidentifier() else 'scanner'}_{digest}"
+
+
+def load_scanner(path: str, module_name: str | None = None) -> GeneratedScanner:
+    """
+    import a generated scanner module from path
+    :param module_name: name registered in sys.modules, defaults to scanner_module_name(path).
+                        a name already taken by a module from another file is refused
+    """
+    if module_name is None:
+        module_name = scanner_module_name(path)
+
+    loaded = sys.modules.get(module_name)
+    if loaded is not None and os.path.abspath(getattr(loaded, "__file__", None) or "") != os.path.abspath(path):
+        raise RuntimeError(f"Module name {module_name} is already used by {loaded!r}")
+
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None:
+        raise RuntimeError(f"Can't load scanner module {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return GeneratedScanner(module)
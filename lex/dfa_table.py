@@ -0,0 +1,265 @@
+from array import array
+from itertools import accumulate
+from typing import Any, Iterable, Iterator
+
+from common.range_map import FrozenRangeMap
+from common.table_compress import CombTable
+from common.token_buffer import TokenBuffer
+from lex.dfa import DFA
+from lex.scan_engine import ScanEngine, decode_utf8
+
+
+class DFATable(ScanEngine):
+    """
+    Frozen DFA, transitions are flattened into a dense `states × classes` matrix (row major),
+    the minimized DFA is read only after lexer build, so everything here is immutable.
+    - transitions[state * class_count + cls] -> next state, DEAD(-1) if no transition
+    - accepts[state] -> label index, NO_LABEL(-1) if not accepted
+    """
+
+    def __init__(self, dfa: DFA, origin: int):
+        if dfa.range_map is None:
+            raise RuntimeError("DFA without range map can't be frozen")
+
+        state_index = {state: idx for idx, state in enumerate(dfa.nodes)}   # dense state id
+
+        class_count = 0
+        def handler(node, *_):
+            nonlocal class_count
+            class_count = max(class_count, node.meta + 1)
+        dfa.range_map.dfs(dlr_handler=handler)
+
+        transitions = array('i', [DFATable.DEAD]) * (len(state_index) * class_count)
+        for (origin_state, symbol), dest in dfa.edges.items():
+            transitions[state_index[origin_state] * class_count + symbol] = state_index[dest]
+
+        labels = []
+        label_index = {}
+        accepts = array('i', [DFATable.NO_LABEL]) * len(state_index)
+        for state, node_info in dfa.nodes.items():
+            if not node_info.accept:
+                continue
+            if node_info.label not in label_index:
+                label_index[node_info.label] = len(labels)
+                labels.append(node_info.label)
+            accepts[state_index[state]] = label_index[node_info.label]
+
+        self.__origin = state_index[origin]
+        self.__class_count = class_count
+        self.__transitions = transitions
+        self.__accepts = accepts
+        self.__labels = tuple(labels)
+        self.__frozen_range_map = dfa.range_map.freeze()
+        self.__bounded_transitions: array | None = None     # built by the first tokenize
+
+    @property
+    def origin(self) -> int:
+        return self.__origin
+
+    @property
+    def class_count(self) -> int:
+        return self.__class_count
+
+    @property
+    def state_count(self) -> int:
+        return len(self.__accepts)
+
+    @property
+    def transitions(self) -> array:
+        return self.__transitions
+
+    @property
+    def accepts(self) -> array:
+        return self.__accepts
+
+    @property
+    def labels(self) -> tuple[Any, ...]:
+        return self.__labels
+
+    @property
+    def frozen_range_map(self) -> FrozenRangeMap:
+        return self.__frozen_range_map
+
+    def classify(self, c: str) -> int:
+        """
+        code point -> character class(column)
+        """
+        return self.__frozen_range_map.lookup(c)
+
+    def translate_to(self, state: int, cls: int) -> int:
+        """
+        进行一次转移
+        :return: DEAD(-1) if failed
+        """
+        return self.__transitions[state * self.__class_count + cls]
+
+    def compress(self) -> CombTable:
+        """
+        row displacement compressed transitions, lookup(state, cls) is translate_to(state, cls)
+        """
+        return CombTable.from_dense(self.__transitions, self.__class_count, DFATable.DEAD)
+
+    def advance(self, text: str, pos: int, state: int) -> tuple[int, int, int, int]:
+        transitions, accepts, class_count = self.__transitions, self.__accepts, self.__class_count
+        direct, lookup = self.__frozen_range_map.direct, self.__frozen_range_map.lookup
+        direct_size = FrozenRangeMap.DIRECT_SIZE
+        length = len(text)
+        last_label = DFATable.NO_LABEL
+        last_end = pos
+
+        while pos < length:
+            c = ord(text[pos])
+            state = transitions[state * class_count + (direct[c] if c < direct_size else lookup(c))]
+            if state < 0:
+                break
+            pos += 1
+            if accepts[state] >= 0:         # remember last accepted position, backtrack here later
+                last_label = accepts[state]
+                last_end = pos
+
+        return state, pos, last_label, last_end
+
+    def classify_text(self, text: str) -> array:
+        """
+        character classes of text at once(FrozenRangeMap.classify), for advance_classes.
+        characters not covered by the range map and one extra position after the end get the boundary class
+        (class_count), it is dead in every state, so a run stops there without a bound check
+        """
+        classes = self.__frozen_range_map.classify(text)
+        boundary = self.__class_count
+        if FrozenRangeMap.MISSING in classes:
+            for pos, cls in enumerate(classes):
+                if cls == FrozenRangeMap.MISSING:
+                    classes[pos] = boundary
+        classes.append(boundary)
+        return classes
+
+    def advance_classes(self, classes: array, pos: int, state: int) -> tuple[int, int, int, int]:
+        """
+        same as advance, over characters already classified by classify_text, the loop only indexes ints
+        """
+        transitions, accepts = self.__boundary_transitions(), self.__accepts
+        stride = self.__class_count + 1
+        last_label = DFATable.NO_LABEL
+        last_end = pos
+
+        while True:                                 # the boundary class at the end stops it
+            state = transitions[state * stride + classes[pos]]
+            if state < 0:
+                break
+            pos += 1
+            if accepts[state] >= 0:
+                last_label = accepts[state]
+                last_end = pos
+
+        return state, pos, last_label, last_end
+
+    def __boundary_transitions(self) -> array:
+        """
+        transitions with one more class column, the boundary class(class_count) is dead in every state
+        """
+        if self.__bounded_transitions is None:
+            class_count, stride = self.__class_count, self.__class_count + 1
+            bounded = array('i', [DFATable.DEAD]) * (self.state_count * stride)
+            for state in range(self.state_count):
+                bounded[state * stride:state * stride + class_count] = \
+                    self.__transitions[state * class_count:(state + 1) * class_count]
+            self.__bounded_transitions = bounded
+        return self.__bounded_transitions
+
+    def scan(self, text: str, pos: int = 0) -> Iterator[tuple[Any, int, int]]:
+        """
+        maximal munch over text, classified at once before the munch loop (advance_classes)
+        :return: iterator of (label, start, end), lexeme is text[start:end]
+        """
+        classes = self.classify_text(text)
+        advance, labels, origin = self.advance_classes, self.__labels, self.__origin
+        length = len(text)
+
+        while pos < length:
+            _, _, last_label, last_end = advance(classes, pos, origin)
+
+            if last_label < 0:
+                raise RuntimeError(f"Unexpected character {text[pos]!r} at position {pos}")
+
+            yield labels[last_label], pos, last_end
+            pos = last_end
+
+    def tokenize_batch(self, texts: Iterable[str], labels: Iterable[Any] = ()) -> tuple[TokenBuffer, array]:
+        """
+        texts are joined with a boundary marker and classified at once, the marker class is dead in every state,
+        so one munch loop runs over all of them with no bound check and never crosses a text end
+        """
+        texts = texts if isinstance(texts, (list, tuple)) else list(texts)
+        joined = "\0".join(texts)
+        classes = self.classify_text(joined)
+        boundary = self.__class_count
+        for marker in accumulate(len(text) + 1 for text in texts[:-1]):     # one past the end of each text
+            classes[marker - 1] = boundary
+
+        buffer = TokenBuffer(labels)
+        kinds = [buffer.kind_of(label) for label in self.__labels]
+        kind_column, start_column, end_column, line_column = array('i'), array('i'), array('i'), array('i')
+        append_kind, append_start = kind_column.append, start_column.append
+        append_end, append_line = end_column.append, line_column.append
+
+        transitions, accepts = self.__boundary_transitions(), self.__accepts
+        origin, stride = self.__origin, self.__class_count + 1
+        count_lines = joined.count
+        bounds = array('i', [0])
+        pos = 0
+
+        for text in texts:
+            base, end = pos, pos + len(text)
+            multiline = "\n" in text
+            line = 0
+            while pos < end:
+                state, scan, last_label, last_end = origin, pos, DFATable.NO_LABEL, pos
+                while True:                             # the boundary marker stops it
+                    state = transitions[state * stride + classes[scan]]
+                    if state < 0:
+                        break
+                    scan += 1
+                    if accepts[state] >= 0:
+                        last_label = accepts[state]
+                        last_end = scan
+
+                if last_label < 0:
+                    raise RuntimeError(f"Unexpected character {joined[pos]!r} at position {pos - base}")
+                append_kind(kinds[last_label])
+                append_start(pos - base)
+                append_end(last_end - base)
+                append_line(line)
+                if multiline:
+                    line += count_lines("\n", pos, last_end)
+                pos = last_end
+
+            pos = end + 1
+            bounds.append(len(kind_column))
+
+        return TokenBuffer.from_columns(buffer.labels, kind_column, start_column, end_column, line_column), bounds
+
+    def advance_bytes(self, data, pos: int, state: int) -> tuple[int, int, int, int]:
+        transitions, accepts, class_count = self.__transitions, self.__accepts, self.__class_count
+        direct, lookup = self.__frozen_range_map.direct, self.__frozen_range_map.lookup
+        length = len(data)
+        last_label = DFATable.NO_LABEL
+        last_end = pos
+
+        while pos < length:
+            b = data[pos]
+            if b < 0x80:                    # ascii, byte is code point
+                cls, width = direct[b], 1
+            else:
+                c, width = decode_utf8(data, pos)
+                cls = lookup(c)
+
+            state = transitions[state * class_count + cls]
+            if state < 0:
+                break
+            pos += width
+            if accepts[state] >= 0:
+                last_label = accepts[state]
+                last_end = pos
+
+        return state, pos, last_label, last_end
@@ -0,0 +1,189 @@
+from array import array
+from bisect import bisect_right
+from typing import Any, Sequence
+
+from common.token_buffer import Token, TokenBuffer
+from lex.keyword_table import KeywordTable
+from lex.scan_engine import ScanEngine
+
+
+class IncrementalLexer:
+    """
+    Token buffer of an edited text, kept up to date edit by edit.
+    Every token records its reach: the end of what the dfa read to decide it (one past the stopping character),
+    a token is only affected by an edit before its reach. After an edit scanning restarts at the first affected token,
+    and stops as soon as a new token boundary meets the start of an old token behind the edit:
+    the dfa is at origin there in both streams and the text after is unchanged, so the rest of old tokens is reused.
+    Tokens behind the edit are not moved at once, a pending (gap) shift is kept for tokens[gap:] and applied lazily,
+    so an edit costs the rescanned tokens plus the distance to the previous edit, not the size of the file.
+    """
+
+    def __init__(self, engine: ScanEngine, text: str = "", labels: Sequence[Any] = (),
+                 keywords: KeywordTable | None = None):
+        """
+        :param engine: scan engine
+        :param text: initial text
+        :param labels: labels registered in the buffer first
+        :param keywords: keyword post classification of identifier tokens
+        """
+        self.__engine = engine
+        self.__keywords = keywords
+        self.__text = text
+        self.__tokens = TokenBuffer(labels)
+        self.__lookahead = 1                # max(reach - end) ever seen, bounds the backward search
+
+        tokens, self.__reach, _ = self.__scan(0, 0, None)
+        self.__tokens.splice(0, 0, tokens)
+
+        # tokens[gap:] and reach[gap:] are stale by (gap_shift, gap_lines)
+        self.__gap = len(self.__tokens)
+        self.__gap_shift = 0
+        self.__gap_lines = 0
+
+    @property
+    def text(self) -> str:
+        return self.__text
+
+    @property
+    def tokens(self) -> TokenBuffer:
+        """
+        up to date token buffer (pending shifts are applied first)
+        """
+        self.__materialize(len(self.__tokens))
+        return self.__tokens
+
+    def __len__(self):
+        return len(self.__tokens)
+
+    def token(self, idx: int) -> Token:
+        """
+        (label, start, end, line) of token idx(non-negative), without applying pending shifts
+        """
+        label, start, end, line = self.__tokens[idx]
+        if idx >= self.__gap:
+            return label, start + self.__gap_shift, end + self.__gap_shift, line + self.__gap_lines
+        return label, start, end, line
+
+    def __materialize(self, end: int):
+        """
+        apply pending shift to tokens [gap, end), gap moves to end
+        """
+        gap = self.__gap
+        if end <= gap:
+            return
+        self.__tokens.shift(gap, end, self.__gap_shift, self.__gap_lines)
+        if self.__gap_shift:
+            self.__reach[gap:end] = array('i', map(self.__gap_shift.__add__, self.__reach[gap:end]))
+        self.__gap = end
+        if end == len(self.__tokens):
+            self.__gap_shift = self.__gap_lines = 0
+
+    def __scan(self, pos: int, line: int, resync) -> tuple[TokenBuffer, array, int]:
+        """
+        scan self.__text from pos until resync(end) is true or the end of text
+        :return: (tokens, reach of tokens, end position)
+        """
+        engine, text, keywords = self.__engine, self.__text, self.__keywords
+        advance, origin, labels = engine.advance, engine.origin, engine.labels
+        tokens = TokenBuffer(self.__tokens.labels)
+        append, reach = tokens.append, array('i')
+        length = len(text)
+
+        while pos < length:
+            _, stop, last_label, last_end = advance(text, pos, origin)
+            if last_label < 0:
+                raise RuntimeError(f"Unexpected character {text[pos]!r} at position {pos}")
+
+            label = labels[last_label]
+            if keywords is not None and label == keywords.target:
+                keyword = keywords.lookup(text, pos, last_end)
+                if keyword is not None:
+                    label = keyword
+
+            append(label, pos, last_end, line)
+            reach.append(stop + 1)
+            self.__lookahead = max(self.__lookahead, stop + 1 - last_end)
+            line += text.count("\n", pos, last_end)
+            pos = last_end
+
+            if resync is not None and resync(pos):
+                break
+
+        return tokens, reach, pos
+
+    def __first_affected(self, offset: int) -> int:
+        """
+        first token whose reach is behind offset, tokens before it never read the edited text
+        """
+        count, gap, gap_shift = len(self.__tokens), self.__gap, self.__gap_shift
+        bound = offset - self.__lookahead       # only tokens ending after bound can reach behind offset
+
+        with self.__tokens.ends as ends:
+            first = bisect_right(ends, bound, 0, gap)
+            if first == gap:
+                first = bisect_right(ends, bound - gap_shift, gap, count)
+
+        reach = self.__reach
+        while first < count and reach[first] + (gap_shift if first >= gap else 0) <= offset:
+            first += 1
+        return first
+
+    def edit(self, offset: int, deleted: int, inserted: str) -> tuple[int, int, int]:
+        """
+        replace text[offset:offset + deleted] by inserted and re-lex the affected tokens
+        :return: (first, removed, added) tokens[first:first + removed] were replaced by tokens[first:first + added]
+        """
+        text = self.__text
+        if offset < 0 or deleted < 0 or offset + deleted > len(text):
+            raise IndexError("edit out of range")
+
+        count = len(self.__tokens)
+        edit_end = offset + deleted
+        delta = len(inserted) - deleted
+        line_delta = inserted.count("\n") - text.count("\n", offset, edit_end)
+
+        # the last token always reads the end of text, so first == count only for empty text
+        first = self.__first_affected(offset)
+        self.__materialize(first)               # gap >= first from here on
+        pos, line = 0, 0
+        if first < count:
+            _, pos, _, line = self.token(first)
+
+        # old token behind the edit, shifted by delta, starts where a new token ends: back in sync
+        cursor = first
+
+        def resync(end: int) -> bool:
+            nonlocal cursor
+            while cursor < count and self.token(cursor)[1] + delta < end:
+                cursor += 1
+            if cursor == count:
+                return False
+            start = self.token(cursor)[1]
+            return start >= edit_end and start + delta == end
+
+        self.__text = text[:offset] + inserted + text[edit_end:]
+        try:
+            tokens, reach, end = self.__scan(pos, line, resync)
+        except RuntimeError:
+            self.__text = text
+            raise
+        last = cursor if end < len(self.__text) else count
+
+        # tokens [last, gap) are up to date and move by delta now, tokens[gap:] keep a pending shift
+        if not (self.__gap_shift or self.__gap_lines):
+            self.__gap = min(self.__gap, last)      # nothing pending, the whole tail can share the new shift
+        gap = max(self.__gap, last)
+        self.__tokens.shift(last, gap, delta, line_delta)
+        if delta:
+            self.__reach[last:gap] = array('i', map(delta.__add__, self.__reach[last:gap]))
+
+        self.__tokens.splice(first, last, tokens)
+        self.__reach[first:last] = reach
+        self.__gap = gap - last + first + len(tokens)
+        if self.__gap == len(self.__tokens):
+            self.__gap_shift = self.__gap_lines = 0
+        else:
+            self.__gap_shift += delta
+            self.__gap_lines += line_delta
+
+        return first, last - first, len(tokens)
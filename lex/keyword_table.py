@@ -0,0 +1,102 @@
+from typing import Any, Iterable, Iterator
+
+from common.token_buffer import TokenBuffer
+
+
+class KeywordTable:
+    """
+    Keyword post classification: the dfa only recognizes the identifier token (target),
+    identifier lexemes are looked up here and relabeled if they are keywords.
+    Lookup is one dict probe with the lexeme. Keywords don't take part in dfa construction,
+    changing them needs no rebuild.
+    """
+
+    def __init__(self, keywords: dict[str, Any], target: Any = "IDENTIFIER"):
+        """
+        :param keywords: keyword -> label
+        :param target: label of identifier tokens to reclassify
+        """
+        if any(not keyword for keyword in keywords):
+            raise ValueError("Empty keyword")
+
+        self.__keywords = dict(keywords)
+        self.__target = target
+        self.__bytes_keywords = {keyword.encode("utf-8"): label for keyword, label in keywords.items()}
+
+    @property
+    def target(self) -> Any:
+        return self.__target
+
+    @property
+    def keywords(self) -> dict[str, Any]:
+        return self.__keywords
+
+    @property
+    def labels(self) -> list[Any]:
+        """
+        distinct keyword labels, in keyword order
+        """
+        return list(dict.fromkeys(self.__keywords.values()))
+
+    def lookup(self, text: str, start: int, end: int) -> Any | None:
+        """
+        :return: keyword label of text[start:end], None if it's not a keyword
+        """
+        return self.__keywords.get(text[start:end])
+
+    def lookup_bytes(self, data, start: int, end: int) -> Any | None:
+        """
+        same as lookup, over utf-8 encoded bytes(bytes, mmap)
+        """
+        return self.__bytes_keywords.get(data[start:end])
+
+    def reclassify(self, tokens: Iterable[tuple], text: str) -> Iterator[tuple]:
+        """
+        relabel identifier tokens (label, start, end, ...) of text
+        """
+        target, get = self.__target, self.__keywords.get
+        for token in tokens:
+            if token[0] == target:
+                label = get(text[token[1]:token[2]])
+                if label is not None:
+                    token = (label, *token[1:])
+            yield token
+
+    def reclassify_bytes(self, tokens: Iterable[tuple], data) -> Iterator[tuple]:
+        target, get = self.__target, self.__bytes_keywords.get
+        for token in tokens:
+            if token[0] == target:
+                label = get(data[token[1]:token[2]])
+                if label is not None:
+                    token = (label, *token[1:])
+            yield token
+
+    def reclassify_lexemes(self, tokens: Iterable[tuple]) -> Iterator[tuple]:
+        """
+        relabel identifier tokens (label, start, end, lexeme) carrying their own lexeme(stream tokens)
+        """
+        target, get = self.__target, self.__keywords.get
+        for token in tokens:
+            if token[0] == target:
+                label = get(token[3])
+                if label is not None:
+                    token = (label, *token[1:])
+            yield token
+
+    def reclassify_buffer(self, buffer: TokenBuffer, text: str) -> TokenBuffer:
+        """
+        relabel identifier tokens of buffer in place, only the kinds column is written
+        """
+        if self.__target not in buffer.labels:
+            return buffer
+        target = buffer.kind_of(self.__target)
+        kinds = {label: buffer.kind_of(label) for label in self.labels}
+        get = self.__keywords.get
+
+        with buffer.kinds as column, buffer.starts as starts, buffer.ends as ends:
+            for i in range(len(column)):
+                if column[i] == target:
+                    label = get(text[starts[i]:ends[i]])
+                    if label is not None:
+                        column[i] = kinds[label]
+        return buffer
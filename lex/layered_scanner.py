@@ -0,0 +1,99 @@
+from typing import Any, Iterator
+
+from common.token_buffer import TokenBuffer
+from lex.keyword_table import KeywordTable
+from lex.lexer import Lexer
+from lex.scan_engine import ScanEngine
+
+# (advance, origin, labels, ignore, keywords) of one category
+Candidate = tuple[Any, int, tuple[Any, ...], bool, KeywordTable | None]
+
+
+class LayeredScanner:
+    """
+    Two-level scanner over LayeringLexerBuilder tables.
+    The first character picks the categories whose prefix can start there (a direct array for ascii),
+    the inner dfa of each candidate runs with maximal munch and the longest match wins (earlier category on tie).
+    Tokens of ignored categories are skipped without being built, keyword tables of categories relabel their identifiers.
+    """
+    DIRECT_SIZE = 128
+
+    def __init__(self, outer: dict[str, tuple[str, ...]], inner: dict[str, Lexer], ignore: set[str]):
+        """
+        :param outer: category -> prefixes, a prefix is a character, a range "a-z", or a string (its first character counts)
+        :param inner: category -> inner lexer
+        :param ignore: categories not emitted
+        """
+        direct: list[list[Candidate]] = [[] for _ in range(LayeredScanner.DIRECT_SIZE)]
+        wide: dict[int, list[Candidate]] = {}
+
+        for typ, prefixes in outer.items():
+            lexer = inner.get(typ)
+            if lexer is None:
+                continue
+            engine = lexer.table
+            candidate = (engine.advance, engine.origin, tuple(engine.labels), typ in ignore, lexer.keywords)
+
+            chars = set()
+            for prefix in prefixes:
+                if len(prefix) == 3 and prefix[1] == "-":
+                    chars.update(range(ord(prefix[0]), ord(prefix[2]) + 1))
+                elif prefix:
+                    chars.add(ord(prefix[0]))
+
+            for c in chars:
+                candidates = direct[c] if c < LayeredScanner.DIRECT_SIZE else wide.setdefault(c, [])
+                candidates.append(candidate)
+
+        self.__direct = tuple(tuple(candidates) for candidates in direct)
+        self.__wide = {c: tuple(candidates) for c, candidates in wide.items()}
+
+    def candidates(self, c: str) -> int:
+        """
+        :return: number of categories dispatched by character c
+        """
+        c = ord(c)
+        return len(self.__direct[c] if c < LayeredScanner.DIRECT_SIZE else self.__wide.get(c, ()))
+
+    def scan(self, text: str, pos: int = 0) -> Iterator[tuple[Any, int, int]]:
+        """
+        :return: iterator of (label, start, end) of not ignored tokens
+        """
+        direct, wide, direct_size = self.__direct, self.__wide, LayeredScanner.DIRECT_SIZE
+        length = len(text)
+
+        while pos < length:
+            c = ord(text[pos])
+            candidates = direct[c] if c < direct_size else wide.get(c, ())
+
+            label, end, candidate = ScanEngine.NO_LABEL, pos, None
+            for current in candidates:
+                _, _, last_label, last_end = current[0](text, pos, current[1])
+                if last_label >= 0 and last_end > end:
+                    label, end, candidate = last_label, last_end, current
+
+            if label < 0:
+                raise RuntimeError(f"Unexpected character {text[pos]!r} at position {pos}")
+
+            _, _, labels, ignore, keywords = candidate
+            if not ignore:
+                label = labels[label]
+                if keywords is not None and label == keywords.target:
+                    keyword = keywords.lookup(text, pos, end)
+                    if keyword is not None:
+                        label = keyword
+                yield label, pos, end
+            pos = end
+
+    def tokenize(self, text: str) -> TokenBuffer:
+        """
+        :return: token buffer of not ignored tokens, line is 0 based
+        """
+        buffer = TokenBuffer()
+        append, count_lines = buffer.append, text.count
+        line, last = 0, 0
+        for label, start, end in self.scan(text):
+            line += count_lines("\n", last, start)
+            last = start
+            append(label, start, end, line)
+        return buffer
@@ -0,0 +1,225 @@
+from array import array
+from typing import Any, Sequence
+
+from common.common_type import EPSILON, SymbolType
+from common.range_map import FrozenRangeMap
+from lex.nfa import NFA, iter_bits
+from lex.scan_engine import ScanEngine, decode_utf8
+
+
+class LazyDFA(ScanEngine):
+    """
+    On-demand DFA (RE2 style), no subset construction before scanning.
+    DFA states are materialized from nfa state sets (int bitmask) on first visit,
+    the state cache is bounded, when it's full the whole cache is flushed and rebuilt on demand.
+    Scanning interface is the same as DFATable(ScanEngine).
+    """
+    UNKNOWN = -2
+    ORIGIN = 0
+
+    def __init__(self, nfa: NFA, origin: int, cache_size: int = 4096):
+        """
+        :param nfa: combined nfa, accepting states carry label and priority
+        :param origin: initial state of nfa
+        :param cache_size: max number of materialized dfa states
+        """
+        if nfa.range_map is None:
+            raise RuntimeError("NFA without range map can't be scanned")
+        if cache_size < 2:
+            raise ValueError("cache_size must be at least 2")
+
+        self.nfa = nfa
+        self.__cache_size = cache_size
+
+        self.__index_state: list[int] = nfa.index_state     # same bit positions as nfa.closure_mask
+        self.__state_index: dict[int, int] = nfa.state_index
+
+        self.__moves: list[dict[SymbolType, list[int]] | None] = [None] * len(self.__index_state)
+        for (state, symbol), dests in nfa.edges.items():    # nfa state -> {symbol: dest states}
+            if symbol == EPSILON:
+                continue
+            idx = self.__state_index[state]
+            if self.__moves[idx] is None:
+                self.__moves[idx] = {}
+            self.__moves[idx][symbol] = list(dests)
+
+        self.__accept_mask = 0
+        for idx, state in enumerate(self.__index_state):
+            if nfa.nodes[state].accept:
+                self.__accept_mask |= 1 << idx
+
+
+        self.__frozen_range_map = nfa.range_map.freeze()
+        class_count = 0
+        def handler(node, *_):
+            nonlocal class_count
+            class_count = max(class_count, node.meta + 1)
+        nfa.range_map.dfs(dlr_handler=handler)
+        self.__class_count = class_count
+
+        self.__labels: list[Any] = []
+        self.__label_index: dict[Any, int] = {}
+        self.__origin_mask = nfa.closure_mask(origin)
+        self.flush_count = 0
+        self.__flush()
+
+    @property
+    def cache_size(self) -> int:
+        return self.__cache_size
+
+    @property
+    def state_count(self) -> int:
+        """
+        number of dfa states currently materialized
+        """
+        return len(self.__masks)
+
+    @property
+    def origin(self) -> int:
+        return LazyDFA.ORIGIN
+
+    @property
+    def labels(self) -> Sequence[Any]:
+        """
+        label index -> label, grows while new accepting states are found
+        """
+        return self.__labels
+
+    @property
+    def frozen_range_map(self) -> FrozenRangeMap:
+        return self.__frozen_range_map
+
+    def __step_mask(self, idx: int, symbol: SymbolType) -> int:
+        """
+        ε-closure(move(nfa state, symbol))
+        """
+        k = (idx, symbol)
+        mask = self.__step_masks.get(k)
+        if mask is None:
+            mask = 0
+            moves = self.__moves[idx]
+            for dest in (moves.get(symbol, ()) if moves is not None else ()):
+                mask |= self.nfa.closure_mask(dest)
+            self.__step_masks[k] = mask
+        return mask
+
+    def __accept_label(self, mask: int) -> int:
+        """
+        label with min priority among accepting nfa states, NO_LABEL if nothing accepted
+        """
+        best = None
+        for idx in iter_bits(mask & self.__accept_mask):
+            node = self.nfa.nodes[self.__index_state[idx]]
+            if best is None or (node.priority is not None and (best.priority is None or node.priority < best.priority)):
+                best = node
+
+        if best is None:
+            return LazyDFA.NO_LABEL
+        if best.label not in self.__label_index:
+            self.__label_index[best.label] = len(self.__labels)
+            self.__labels.append(best.label)
+        return self.__label_index[best.label]
+
+    def __flush(self):
+        """
+        drop all materialized states and the nfa step/closure masks behind them, origin is always state ORIGIN(0)
+        """
+        self.__step_masks: dict[tuple[int, SymbolType], int] = {}   # (nfa state index, symbol) -> bitmask
+        self.nfa.clear_closure_cache()
+        self.__state_ids: dict[int, int] = {}
+        self.__masks: list[int] = []
+        self.__rows: list[array] = []
+        self.__accepts: list[int] = []
+        self.__add_state(self.__origin_mask)
+
+    def __add_state(self, mask: int) -> int:
+        state = len(self.__masks)
+        self.__state_ids[mask] = state
+        self.__masks.append(mask)
+        self.__rows.append(array('i', [LazyDFA.UNKNOWN]) * self.__class_count)
+        self.__accepts.append(self.__accept_label(mask))
+        return state
+
+    def translate_to(self, state: int, cls: int) -> int:
+        """
+        transition of a materialized state, computed and cached on first use.
+        cache may be flushed here, so ids returned before this call become invalid
+        :return: DEAD(-1) if failed
+        """
+        dest = self.__rows[state][cls]
+        if dest != LazyDFA.UNKNOWN:
+            return dest
+
+        mask = 0
+        for idx in iter_bits(self.__masks[state]):
+            mask |= self.__step_mask(idx, cls)
+
+        if mask == 0:
+            self.__rows[state][cls] = LazyDFA.DEAD
+            return LazyDFA.DEAD
+
+        dest = self.__state_ids.get(mask)
+        if dest is None:
+            if len(self.__masks) >= self.__cache_size:      # full, flush and go on from scratch
+                self.flush_count += 1
+                self.__flush()
+                dest = self.__state_ids.get(mask)           # only origin survives
+                return dest if dest is not None else self.__add_state(mask)
+            dest = self.__add_state(mask)
+
+        self.__rows[state][cls] = dest
+        return dest
+
+    def advance(self, text: str, pos: int, state: int) -> tuple[int, int, int, int]:
+        direct, lookup = self.__frozen_range_map.direct, self.__frozen_range_map.lookup
+        direct_size = FrozenRangeMap.DIRECT_SIZE
+        rows, accepts, translate_to = self.__rows, self.__accepts, self.translate_to
+        length = len(text)
+        last_label = LazyDFA.NO_LABEL
+        last_end = pos
+
+        while pos < length:
+            c = ord(text[pos])
+            cls = direct[c] if c < direct_size else lookup(c)
+            dest = rows[state][cls]
+            if dest == LazyDFA.UNKNOWN:
+                dest = translate_to(state, cls)
+                rows, accepts = self.__rows, self.__accepts     # may be flushed
+            state = dest
+            if state < 0:
+                break
+            pos += 1
+            if accepts[state] >= 0:
+                last_label = accepts[state]
+                last_end = pos
+
+        return state, pos, last_label, last_end
+
+    def advance_bytes(self, data, pos: int, state: int) -> tuple[int, int, int, int]:
+        direct, lookup = self.__frozen_range_map.direct, self.__frozen_range_map.lookup
+        rows, accepts, translate_to = self.__rows, self.__accepts, self.translate_to
+        length = len(data)
+        last_label = LazyDFA.NO_LABEL
+        last_end = pos
+
+        while pos < length:
+            b = data[pos]
+            if b < 0x80:
+                cls, width = direct[b], 1
+            else:
+                c, width = decode_utf8(data, pos)
+                cls = lookup(c)
+
+            dest = rows[state][cls]
+            if dest == LazyDFA.UNKNOWN:
+                dest = translate_to(state, cls)
+                rows, accepts = self.__rows, self.__accepts
+            state = dest
+            if state < 0:
+                break
+            pos += width
+            if accepts[state] >= 0:
+                last_label = accepts[state]
+                last_end = pos
+
+        return state, pos, last_label, last_end
@@ -1,8 +1,21 @@
+import asyncio
 import logging
-from typing import Any
+from array import array
+from typing import Any, AsyncIterator, IO, Iterable, Iterator
 
+from common.token_buffer import TokenBuffer
+from lex.codegen import GeneratedScanner, ScannerEmitter, load_scanner
 from lex.dfa import DFA
-from lex.regex_compiler import RegexLexer, RegexCompiler, DFAOptimizer, N2DConvertor
+from lex.dfa_table import DFATable
+from lex.incremental import IncrementalLexer
+from lex.keyword_table import KeywordTable
+from lex.lazy_dfa import LazyDFA
+from lex.lexer_cache import LexerCache
+from lex.mapped_source import MappedSource
+from lex.parallel import tokenize_files
+from lex.regex_compiler import RegexLexer, RegexCompiler, DFAOptimizer, N2DConvertor, AlphabetMerger, \
+    DFATrimmer
+from lex.stream_scanner import StreamScanner, StreamToken
 
 
 class Lexer:
@@ -10,18 +23,24 @@ class Lexer:
 
 
     def __initialize(self):
-        regex_compiler = RegexCompiler()
+        regex_compiler = RegexCompiler(construction=self.__construction)
         groups, self.__range_map = RegexLexer.parse_group(self.__groups)
 
-        origin, nfa = regex_compiler.compile_group(groups, self.__range_map)
+        if self.__construction == RegexCompiler.Construction.DIRECT:
+            origin, dfa = regex_compiler.compile_group_dfa(groups, self.__range_map,
+                                                           enable_multi_label=self.__minimization)
+        else:
+            origin, nfa = regex_compiler.compile_group(groups, self.__range_map)
 
-        cvt = N2DConvertor(nfa, origin, enable_multi_label=self.__minimization)
-        origin, dfa = cvt.convert()
+            cvt = N2DConvertor(nfa, origin, enable_multi_label=self.__minimization)
+            origin, dfa = cvt.convert()
+        origin, dfa = DFATrimmer(dfa, origin).trim()        # drop unreachable and dead states before minimization
 
         opt_type = DFAOptimizer.LabelType.MULTI if self.__minimization else DFAOptimizer.LabelType.SINGLE
         opt = DFAOptimizer(dfa, origin, opt_type)
 
         origin, dfa = opt.optimize()
+        origin, dfa = AlphabetMerger(dfa, origin).merge()      # merge equivalent symbol columns
 
         if not self.__minimization:
             return origin, dfa
@@ -48,17 +67,64 @@ class Lexer:
 
 
 
-    def __init__(self, pattern_group: list[tuple[Any, str]], minimization: bool = False):
+    def __load(self, cache_dir: str | None):
+        if cache_dir is None:
+            return self.__initialize()
+
+        cache = LexerCache(cache_dir)
+        cached = cache.load(self.__groups, self.__minimization)
+        if cached is not None:
+            return cached
+
+        origin, dfa = self.__initialize()
+        cache.store(self.__groups, self.__minimization, origin, dfa)
+        return origin, dfa
+
+    def __initialize_lazy(self, cache_size: int):
+        """
+        lazy mode, only regex -> nfa, dfa states are built while scanning.
+        always the ε-free position(GLUSHKOV) nfa: no closure to compute, dfa states only hold positions
+        """
+        groups, range_map = RegexLexer.parse_group(self.__groups)
+        origin, nfa = RegexCompiler(construction=RegexCompiler.Construction.GLUSHKOV).compile_group(groups, range_map)
+        return origin, LazyDFA(nfa, origin, cache_size)
+
+    def __init__(self, pattern_group: list[tuple[Any, str]], minimization: bool = False, cache_dir: str | None = None,
+                 lazy: bool = False, cache_size: int = 4096, keywords: KeywordTable | None = None,
+                 construction: RegexCompiler.Construction | None = None):
         """
         :param pattern_group:
         :param minimization: if try to minimize in Optimizer(try to split less at the beginning)
+        :param cache_dir: directory of compiled dfa cache, None to always rebuild, only for eager(not lazy) mode
+        :param lazy: skip subset construction, materialize dfa states on demand while scanning(no dfa available)
+        :param cache_size: max dfa states kept in lazy mode
+        :param keywords: keyword post classification of identifier tokens, keywords stay out of the dfa
+        :param construction: regex -> nfa construction, None for THOMPSON,
+                             GLUSHKOV gives an ε-free nfa with one state per position,
+                             DIRECT builds the dfa from followpos without any nfa.
+                             lazy mode always uses GLUSHKOV, other constructions can't be used with lazy
         """
 
         self.__groups: list[tuple[str, str]] = pattern_group
         self.__minimization = minimization
-        self.__origin, self.__dfa = self.__initialize()
+        self.__keywords = keywords
+        self.__construction = RegexCompiler.Construction.THOMPSON if construction is None else construction
+        self.__table: DFATable | LazyDFA | GeneratedScanner | None = None
+
+        if lazy:
+            if cache_dir is not None:
+                raise ValueError("Lazy lexer has no dfa to cache, cache_dir can't be used with lazy")
+            if construction not in (None, RegexCompiler.Construction.GLUSHKOV):
+                raise ValueError(f"Lazy lexer always uses GLUSHKOV, {construction.name} can't be used with lazy")
+            self.__dfa = None
+            self.__origin, self.__table = self.__initialize_lazy(cache_size)
+        else:
+            self.__origin, self.__dfa = self.__load(cache_dir)
 
     def check(self):
+        if self.__dfa is None:
+            raise RuntimeError("Lazy lexer has no dfa to check")
+
         cnt = 0
         names = {item[0] for item in self.__groups}
 
@@ -90,11 +156,159 @@ class Lexer:
 
 
     @property
-    def dfa(self) -> DFA:
+    def dfa(self) -> DFA | None:
+        """
+        None in lazy mode
+        """
         return self.__dfa
 
     @property
     def origin(self) -> int:
         return self.__origin
 
+    @property
+    def keywords(self) -> KeywordTable | None:
+        return self.__keywords
+
+    @property
+    def lazy(self) -> bool:
+        return self.__dfa is None
+
+    @property
+    def table(self) -> DFATable | LazyDFA | GeneratedScanner:
+        """
+        frozen transition table, built on first use; LazyDFA in lazy mode, generated module after compile_scanner
+        """
+        if self.__table is None:
+            self.__table = DFATable(self.__dfa, self.__origin)
+        return self.__table
+
+    def compile_scanner(self, path: str, module_name: str | None = None) -> GeneratedScanner:
+        """
+        generate a python scanner module from the dfa, then scan with it
+        :param path: .py file to write, it can be loaded again by lex.codegen.load_scanner
+        :param module_name: name of the imported module, defaults to a unique name derived from path
+                            (lex.codegen.scanner_module_name)
+        """
+        if self.__dfa is None:
+            raise RuntimeError("Lazy lexer has no dfa to generate")
+
+        ScannerEmitter(self.__dfa, self.__origin).write(path)
+        self.__table = load_scanner(path, module_name)
+        return self.__table
+
+    def __names(self) -> list[Any]:
+        names = [name for name, _ in self.__groups]
+        if self.__keywords is not None:
+            names.extend(self.__keywords.labels)
+        return names
+
+    def scan(self, text: str) -> Iterator[tuple[Any, int, int]]:
+        """
+        table-driven maximal munch scanning
+        :param text: source text
+        :return: iterator of (label, start, end), lexeme is text[start:end]
+        """
+        tokens = self.table.scan(text)
+        if self.__keywords is not None:
+            tokens = self.__keywords.reclassify(tokens, text)
+        return tokens
+
+    def tokenize(self, text: str) -> TokenBuffer:
+        """
+        scan text into a columnar token buffer, no per token object is allocated
+        :return: buffer of (label, start, end, line), line is 0 based, kinds follow pattern group order
+        """
+        buffer = self.table.tokenize(text, self.__names())
+        if self.__keywords is not None:
+            self.__keywords.reclassify_buffer(buffer, text)
+        return buffer
+
+    def scan_batch(self, texts: Iterable[str]) -> tuple[TokenBuffer, array]:
+        """
+        tokenize many short texts in one call, the frozen table and the label numbering are shared by all of them
+        :return: (buffer, bounds), tokens of texts[i] are buffer[bounds[i]:bounds[i + 1]],
+                 their offsets and lines are relative to texts[i]
+        """
+        texts = texts if isinstance(texts, (list, tuple)) else list(texts)
+        buffer, bounds = self.table.tokenize_batch(texts, self.__names())
+        if self.__keywords is not None:
+            for i, text in enumerate(texts):
+                if bounds[i] != bounds[i + 1]:
+                    self.__keywords.reclassify_buffer(buffer[bounds[i]:bounds[i + 1]], text)
+        return buffer, bounds
+
+    def tokenize_many(self, paths: Iterable[str], workers: int | None = None, encoding: str = "utf-8") -> list[TokenBuffer]:
+        """
+        tokenize many files in a process pool, frozen tables are shipped to each worker once
+        :param paths: source files
+        :param workers: number of processes, None for cpu count, 1 to run in this process
+        :param encoding: encoding of source files
+        :return: token buffers in the order of paths
+        """
+        return tokenize_files(self.table, list(paths), self.__names(), workers, encoding, self.__keywords)
+
+    def incremental(self, text: str = "") -> IncrementalLexer:
+        """
+        token buffer of text kept up to date by edit(offset, deleted, inserted), only affected tokens are rescanned
+        """
+        return IncrementalLexer(self.table, text, self.__names(), self.__keywords)
+
+    def scan_file(self, path: str) -> MappedSource:
+        """
+        memory-map a utf-8 file and scan its bytes in place
+            with lexer.scan_file(path) as source:
+                for label, start, end in source:
+                    source.lexeme(start, end)
+        :return: mapped source, iterating it gives (label, start, end) byte offsets
+        """
+        return MappedSource(path, self.table, self.__keywords)
+
+    def tokenize_stream(self, fileobj: IO, chunk_size: int = 1 << 16, encoding: str = "utf-8") -> Iterator[StreamToken]:
+        """
+        incremental scanning over a file object (text or binary), the file is never read as a whole
+        :param fileobj: object with read(size), binary chunks are decoded incrementally
+        :param chunk_size: size of each read
+        :param encoding: encoding of binary chunks
+        :return: iterator of (label, start, end, lexeme), offsets are character offsets in the stream
+        """
+        tokens = self.__tokenize_stream(fileobj, chunk_size, encoding)
+        if self.__keywords is not None:
+            tokens = self.__keywords.reclassify_lexemes(tokens)
+        return tokens
+
+    async def atokenize(self, reader: asyncio.StreamReader, chunk_size: int = 1 << 16, encoding: str = "utf-8",
+                        slice_size: int = 4096) -> AsyncIterator[StreamToken]:
+        """
+        incremental scanning over an asyncio stream(socket, subprocess pipe), dfa state is kept across reads
+            async for label, start, end, lexeme in lexer.atokenize(reader):
+                ...
+        the next chunk is only read when the consumer asks for more tokens, a slow consumer holds the reader back
+        :param reader: object with coroutine read(size), binary chunks are decoded incrementally
+        :param chunk_size: size of each read
+        :param encoding: encoding of binary chunks
+        :param slice_size: a chunk is scanned slice by slice, control goes back to the event loop after every slice,
+                           so the loop is never blocked longer than scanning slice_size characters(bytes)
+        :return: async iterator of (label, start, end, lexeme), offsets are character offsets in the stream
+        """
+        scanner = StreamScanner(self.table, encoding)
+        keywords = self.__keywords
+
+        while chunk := await reader.read(chunk_size):
+            for start in range(0, len(chunk), slice_size):
+                tokens = scanner.feed(chunk[start:start + slice_size])
+                for token in tokens if keywords is None else keywords.reclassify_lexemes(tokens):
+                    yield token
+                await asyncio.sleep(0)
+
+        tokens = scanner.close()
+        for token in tokens if keywords is None else keywords.reclassify_lexemes(tokens):
+            yield token
+
+    def __tokenize_stream(self, fileobj: IO, chunk_size: int, encoding: str) -> Iterator[StreamToken]:
+        scanner = StreamScanner(self.table, encoding)
+        while chunk := fileobj.read(chunk_size):
+            yield from scanner.feed(chunk)
+        yield from scanner.close()
+
 
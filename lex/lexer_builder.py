@@ -2,6 +2,8 @@ import abc
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 
+from lex.keyword_table import KeywordTable
+from lex.layered_scanner import LayeredScanner
 from lex.lexer import Lexer
 
 
@@ -9,7 +11,11 @@ class LexerBuilder(ABC):
     """
     分层DFA
     """
-    def __init__(self):
+    def __init__(self, cache_dir: str | None = None):
+        """
+        :param cache_dir: directory of compiled dfa cache, None to always rebuild
+        """
+        self._cache_dir = cache_dir
         self.lexer = self.__parse()
 
     def _pattern(self):
@@ -19,9 +25,8 @@ class LexerBuilder(ABC):
             ("COMMENT", "|".join(map(lambda x: f"({x})", self.comment))),
             ("SPACE", "|".join(map(lambda x: f"({x})", self.space))),
             *text,
-            (f"KEYWORD", "|".join(self.keywords)),
             # *literal,
-            (f"OP", "|".join(self.operators.values())),
+            (f"OP", "|".join(op for op in self.operators.values() if op not in self.keywords)),
             ("BRACKET", "|".join(map(lambda x: f"\\{x}", self.brackets.values())))
         ]
         for k, v in self.other.items():
@@ -32,9 +37,16 @@ class LexerBuilder(ABC):
         return pattern_group
 
 
+    def _keyword_table(self) -> KeywordTable:
+        """
+        keywords are relabeled from identifiers after scanning, they are not part of the dfa
+        """
+        return KeywordTable({keyword: "KEYWORD" for keyword in self.keywords}, target="IDENTIFIER")
+
     def __parse(self):
         pattern_group = self._pattern()
-        return Lexer(pattern_group=pattern_group, minimization=False)
+        return Lexer(pattern_group=pattern_group, minimization=False, cache_dir=self._cache_dir,
+                     keywords=self._keyword_table())
 
 
 
@@ -95,8 +107,8 @@ class LexerBuilder(ABC):
 
 
 class CLexerBuilder(LexerBuilder):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, cache_dir: str | None = None):
+        super().__init__(cache_dir)
 
     @property
     def keywords(self) -> tuple[str, ...]:
@@ -181,13 +193,19 @@ class LayeringPatten:
     detail: dict[str, str]
     comment: str
     ignore: bool = field(default=False)
+    keywords: dict[str, str] = field(default_factory=dict)    # keyword -> label, relabeled from IDENTIFIER
 
 class LayeringLexerBuilder(abc.ABC):
-    def __init__(self):
+    def __init__(self, cache_dir: str | None = None):
+        """
+        :param cache_dir: directory of compiled dfa cache, None to always rebuild
+        """
+        self._cache_dir = cache_dir
         outer, inner_lex, ignore = self._compile()
         self.outer = outer
         self.inner_dfa = inner_lex
         self.ignore = ignore
+        self.scanner = LayeredScanner(outer, inner_lex, ignore)
 
     def _compile(self):
         pattens = self.get_pattens()
@@ -195,16 +213,31 @@ class LayeringLexerBuilder(abc.ABC):
         ignore = set()
         inner_dfa = {}
         for patten in pattens:
-            if patten.ignore:
-                ignore.add(patten.typ.upper())
             typ = f"DFA_{patten.typ.upper()}"
+            if patten.ignore:
+                ignore.add(typ)
             outer[typ] = patten.prefix
             patten_group = [(k.upper(), v) for k, v in patten.detail.items()]
             if not patten_group:
                 inner_dfa[typ] = None
-            inner_dfa[typ] = Lexer(patten_group)
+                continue
+            keywords = KeywordTable(patten.keywords) if patten.keywords else None
+            inner_dfa[typ] = Lexer(patten_group, cache_dir=self._cache_dir, keywords=keywords)
         return outer, inner_dfa, ignore
 
+    def scan(self, text: str):
+        """
+        first character dispatch + inner dfa maximal munch, ignored categories are skipped
+        :return: iterator of (label, start, end)
+        """
+        return self.scanner.scan(text)
+
+    def tokenize(self, text: str):
+        """
+        :return: TokenBuffer of not ignored tokens
+        """
+        return self.scanner.tokenize(text)
+
 
 
 
@@ -218,22 +251,20 @@ class CLayeringLexerBuilder(LayeringLexerBuilder):
     """
     分层DFA极其高效，加起来不到300个点，不到500条边
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, cache_dir: str | None = None):
+        super().__init__(cache_dir)
 
 
 
     def get_pattens(self) -> list[LayeringPatten]:
-        key_id = {f"keyword_{item}": item for item in self.keywords}
-        key_id.update({f"keyword_{item}": item for item in self.keywords})
+        keywords = {item: f"KEYWORD_{item.upper()}" for item in self.keywords}
 
-        op = {f"op_{k}": v for k, v in self.operators.items()}
+        # keyword operators(sizeof) stay identifiers relabeled by key_id, like CLexerBuilder does
+        op = {f"op_{k}": v for k, v in self.operators.items() if v not in self.keywords}
         op.update({k: f"\\{v}" for k, v in self.brackets.items()})
         op_prefix = set()
         for v in op.values():
-            op_prefix.update(v)
-
-        op_prefix.remove("\\")
+            op_prefix.add(v[1] if v.startswith("\\") else v[0])     # first character, not every character
 
         return [
             LayeringPatten(
@@ -270,17 +301,17 @@ class CLayeringLexerBuilder(LayeringLexerBuilder):
             LayeringPatten(
                 typ="key_id",
                 prefix=("a-z", "A-Z", "_"),
-                detail=key_id,
-                comment="keyword identifier"
+                detail={
+                    "identifier": "[a-zA-Z_][a-zA-Z0-9_]*",
+                },
+                comment="keyword identifier",
+                keywords=keywords,
             ),
             LayeringPatten(
                 typ="string",
                 prefix=('"', ),
                 detail={
-                    "end": '"',
-                    "new_line": r"\\n",
-                    "back": r"\\r",
-                    "char": '.',
+                    "string": '"([^"\\\\\n]|\\\\.)*"',
                 },
                 comment="string",
             ),
@@ -288,14 +319,16 @@ class CLayeringLexerBuilder(LayeringLexerBuilder):
                 typ="char",
                 prefix=("'", ),
                 detail={
-                    "char": ".",
+                    "char": "'([^'\\\\\n]|\\\\.)*'",
                 },
                 comment="char",
             ),
             LayeringPatten(
                 typ="space",
-                prefix=("\n", "\t", "\r", "\v", "\f"),
-                detail={},
+                prefix=(" ", "\n", "\t", "\r", "\v", "\f"),
+                detail={
+                    "space": "[ \t\n\r\v\f]+",
+                },
                 ignore=True,
                 comment="\\n\\t...",
             ),
@@ -303,8 +336,8 @@ class CLayeringLexerBuilder(LayeringLexerBuilder):
                 typ="comment",
                 prefix=("//", "/*"),
                 detail={
-                    "comment": "/\\*.*\\*/",
-                    "comment2": "//.*\n",
+                    "comment": "/\\*([^*]|\\*+[^*/])*\\*+/",
+                    "comment2": "//[^\n]*",
                 },
                 ignore=True,
                 comment="comment",
@@ -312,18 +345,11 @@ class CLayeringLexerBuilder(LayeringLexerBuilder):
             LayeringPatten(
                 typ="terminate",
                 prefix=(";", ),
-                detail={},
-                ignore=True,
-                comment="sep",
-            ),
-            LayeringPatten(
-                typ="identifier",
-                prefix=("a", ),
                 detail={
-                    "identifier": "[a-zA-Z_][a-zA-Z0-9_]*",
+                    "terminate": ";",
                 },
-                comment="identifier",
-            )
+                comment="sep",
+            ),
         ]
 
     @property
@@ -0,0 +1,240 @@
+import hashlib
+import logging
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import chain
+from typing import Any
+
+from common.range_map import RangeMap
+from lex.dfa import DFA
+
+
+class LexerCache:
+    """
+    compiled lexer cache, one file per (pattern_group, minimization), file layout (little endian):
+    - header: magic(4 bytes) + format version(uint16)
+    - counts: origin(int32), states, edges, ranges, labels(uint32 each)
+    - columns: states(int32), accepts(uint8), label ids(int32) of every state, edges (state, symbol, dest)(int32),
+      ranges (beg, end, meta)(uint32)
+    - label table: tagged literals (None, bool, int, float, str, bytes, tuple of them)
+    nothing is unpickled or evaluated, a file written by someone else can only fail to load
+    """
+    MAGIC = b"PCLX"
+    VERSION = 3
+    HEADER = struct.Struct("<4sH")
+    COUNTS = struct.Struct("<iIIII")
+    SUFFIX = ".lexc"
+
+    # label literal tags
+    NONE, FALSE, TRUE, INT, FLOAT, STR, BYTES, TUPLE = range(8)
+    LENGTH = struct.Struct("<I")
+    DOUBLE = struct.Struct("<d")
+
+    def __init__(self, cache_dir: str):
+        self.__cache_dir = cache_dir
+
+    @property
+    def cache_dir(self) -> str:
+        return self.__cache_dir
+
+    @staticmethod
+    def key(pattern_group: list[tuple[Any, str]], minimization: bool) -> str:
+        content = repr((LexerCache.VERSION, minimization, [tuple(item) for item in pattern_group]))
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def path(self, pattern_group: list[tuple[Any, str]], minimization: bool) -> str:
+        return os.path.join(self.__cache_dir, LexerCache.key(pattern_group, minimization) + LexerCache.SUFFIX)
+
+    @staticmethod
+    def __dump_label(label: Any, out: bytearray) -> None:
+        if label is None:
+            out.append(LexerCache.NONE)
+        elif isinstance(label, bool):
+            out.append(LexerCache.TRUE if label else LexerCache.FALSE)
+        elif isinstance(label, int):
+            data = label.to_bytes((label.bit_length() + 8) // 8, "little", signed=True)
+            out.append(LexerCache.INT)
+            out += LexerCache.LENGTH.pack(len(data)) + data
+        elif isinstance(label, float):
+            out.append(LexerCache.FLOAT)
+            out += LexerCache.DOUBLE.pack(label)
+        elif isinstance(label, (str, bytes)):
+            data = label.encode("utf-8") if isinstance(label, str) else label
+            out.append(LexerCache.STR if isinstance(label, str) else LexerCache.BYTES)
+            out += LexerCache.LENGTH.pack(len(data)) + data
+        elif isinstance(label, tuple):
+            out.append(LexerCache.TUPLE)
+            out += LexerCache.LENGTH.pack(len(label))
+            for item in label:
+                LexerCache.__dump_label(item, out)
+        else:
+            raise ValueError(f"Label {label!r} is not a literal, it can't be cached")
+
+    @staticmethod
+    def __load_label(data: memoryview, pos: int) -> tuple[Any, int]:
+        """
+        :return: (label, position after it)
+        """
+        tag = data[pos]
+        pos += 1
+        if tag == LexerCache.NONE:
+            return None, pos
+        if tag in (LexerCache.FALSE, LexerCache.TRUE):
+            return tag == LexerCache.TRUE, pos
+        if tag == LexerCache.FLOAT:
+            return LexerCache.DOUBLE.unpack_from(data, pos)[0], pos + LexerCache.DOUBLE.size
+
+        count, = LexerCache.LENGTH.unpack_from(data, pos)
+        pos += LexerCache.LENGTH.size
+        if tag == LexerCache.TUPLE:
+            items = []
+            for _ in range(count):
+                item, pos = LexerCache.__load_label(data, pos)
+                items.append(item)
+            return tuple(items), pos
+
+        if pos + count > len(data):
+            raise ValueError("Lexer cache label out of range")
+        raw = bytes(data[pos:pos + count])
+        pos += count
+        if tag == LexerCache.INT:
+            return int.from_bytes(raw, "little", signed=True), pos
+        if tag == LexerCache.STR:
+            return raw.decode("utf-8"), pos
+        if tag == LexerCache.BYTES:
+            return raw, pos
+        raise ValueError(f"Unknown lexer cache label tag {tag}")
+
+    @staticmethod
+    def __load_array(typecode: str, data: memoryview, pos: int, count: int) -> tuple[array, int]:
+        column = array(typecode)
+        end = pos + count * column.itemsize
+        if end > len(data):
+            raise ValueError("Lexer cache is truncated")
+        column.frombytes(data[pos:end])
+        if sys.byteorder != "little":
+            column.byteswap()
+        return column, end
+
+    @staticmethod
+    def dumps(origin: int, dfa: DFA) -> bytes:
+        """
+        :raise ValueError: a label is not a literal
+        """
+        label_ids: dict[bytes, int] = {}           # keyed by encoding, True and 1 are different labels
+        states, accepts, state_labels = array('i'), bytearray(), array('i')
+        for state, node_info in dfa.nodes.items():
+            encoded = bytearray()
+            LexerCache.__dump_label(node_info.label, encoded)
+            states.append(state)
+            accepts.append(bool(node_info.accept))
+            state_labels.append(label_ids.setdefault(bytes(encoded), len(label_ids)))
+
+        edges = array('i')
+        for (state, symbol), dest in dfa.edges.items():
+            edges.extend((state, symbol, dest))
+
+        ranges = array('I')
+        dfa.range_map.dfs(ldr_handler=lambda node, *_: ranges.extend((node.beg, node.end, node.meta)))
+
+        columns = [states, state_labels, edges, ranges]
+        if sys.byteorder != "little":
+            for column in columns:
+                column.byteswap()
+
+        return b"".join((
+            LexerCache.HEADER.pack(LexerCache.MAGIC, LexerCache.VERSION),
+            LexerCache.COUNTS.pack(origin, len(states), len(edges) // 3, len(ranges) // 3, len(label_ids)),
+            states.tobytes(), bytes(accepts), state_labels.tobytes(), edges.tobytes(), ranges.tobytes(),
+            *label_ids,
+        ))
+
+    @staticmethod
+    def loads(data: bytes) -> tuple[int, DFA]:
+        """
+        :raise ValueError: not a lexer cache, other version or broken file
+        """
+        try:
+            return LexerCache.__loads(memoryview(data))
+        except (IndexError, struct.error, UnicodeDecodeError, RecursionError, RuntimeError) as e:
+            raise ValueError(f"Broken lexer cache: {e}") from e
+
+    @staticmethod
+    def __loads(data: memoryview) -> tuple[int, DFA]:
+        magic, version = LexerCache.HEADER.unpack_from(data)
+        if magic != LexerCache.MAGIC or version != LexerCache.VERSION:
+            raise ValueError(f"Incompatible lexer cache: {bytes(magic)} v{version}")
+
+        pos = LexerCache.HEADER.size
+        origin, state_count, edge_count, range_count, label_count = LexerCache.COUNTS.unpack_from(data, pos)
+        pos += LexerCache.COUNTS.size
+
+        states, pos = LexerCache.__load_array('i', data, pos, state_count)
+        accepts, pos = LexerCache.__load_array('B', data, pos, state_count)
+        state_labels, pos = LexerCache.__load_array('i', data, pos, state_count)
+        edges, pos = LexerCache.__load_array('i', data, pos, edge_count * 3)
+        ranges, pos = LexerCache.__load_array('I', data, pos, range_count * 3)
+
+        labels = []
+        for _ in range(label_count):
+            label, pos = LexerCache.__load_label(data, pos)
+            labels.append(label)
+        if pos != len(data):
+            raise ValueError("Lexer cache has trailing data")
+
+        begs, ends = ranges[0::3], ranges[1::3]
+        if not begs or begs[1:] != ends[:-1]:
+            raise ValueError("Lexer cache ranges are not contiguous")
+        range_map = RangeMap.from_boundaries(chain(begs, ends[-1:]), ranges[2::3])
+
+        dfa = DFA()
+        dfa.range_map = range_map
+        for state, accept, label_id in zip(states, accepts, state_labels):
+            if not 0 <= label_id < len(labels):
+                raise ValueError(f"Lexer cache label id {label_id} out of range")
+            dfa.add_node(state, accept=bool(accept), label=labels[label_id])
+        if origin not in dfa.nodes:
+            raise ValueError(f"Lexer cache origin {origin} is not a state")
+        for i in range(0, len(edges), 3):
+            dfa.add_edge(edges[i], edges[i + 2], edges[i + 1])
+
+        return origin, dfa
+
+    def load(self, pattern_group: list[tuple[Any, str]], minimization: bool) -> tuple[int, DFA] | None:
+        """
+        :return: (origin, dfa), None if not cached or cache is broken
+        """
+        path = self.path(pattern_group, minimization)
+        try:
+            with open(path, "rb") as f:
+                return LexerCache.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:       # broken or outdated file, just rebuild it
+            logging.warning("Ignore lexer cache {}: {}".format(path, e))
+            return None
+
+    def store(self, pattern_group: list[tuple[Any, str]], minimization: bool, origin: int, dfa: DFA) -> None:
+        """
+        write cache atomically, concurrent workers never see a half written file
+        """
+        try:
+            data = LexerCache.dumps(origin, dfa)
+        except ValueError as e:     # labels that aren't literals, the lexer just isn't cached
+            logging.warning("Skip lexer cache: {}".format(e))
+            return
+
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        path = self.path(pattern_group, minimization)
+
+        fd, temp_path = tempfile.mkstemp(dir=self.__cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
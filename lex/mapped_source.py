@@ -0,0 +1,64 @@
+import mmap
+from typing import Any, Iterator
+
+from lex.keyword_table import KeywordTable
+from lex.scan_engine import ScanEngine
+
+
+class MappedSource:
+    """
+    utf-8 source file mapped into memory, scanned in place.
+    Tokens are (label, start, end) byte offsets into the mapping,
+    lexemes are decoded only when asked by lexeme(start, end), keep the source open while doing so.
+    """
+
+    def __init__(self, path: str, engine: ScanEngine, keywords: KeywordTable | None = None):
+        self.__path = path
+        self.__engine = engine
+        self.__keywords = keywords
+        self.__mapping: mmap.mmap | None = None
+
+        with open(path, "rb") as f:
+            try:
+                self.__mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:          # empty file can't be mapped
+                self.__mapping = None
+        self.__data = self.__mapping if self.__mapping is not None else b""
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def data(self):
+        """
+        mapped bytes (read only)
+        """
+        return self.__data
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __iter__(self) -> Iterator[tuple[Any, int, int]]:
+        tokens = self.__engine.scan_bytes(self.__data)
+        if self.__keywords is not None:
+            tokens = self.__keywords.reclassify_bytes(tokens, self.__data)
+        return tokens
+
+    def lexeme(self, start: int, end: int) -> str:
+        """
+        materialize a token on demand
+        """
+        return self.__data[start:end].decode("utf-8")
+
+    def close(self):
+        if self.__mapping is not None:
+            self.__mapping.close()
+            self.__mapping = None
+        self.__data = b""
+
+    def __enter__(self) -> 'MappedSource':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -7,6 +7,23 @@ from common.replace_util import ReplaceUtil
 from common.common_type import StateType, NodeInfoMap, SymbolType, NodeInfo, NFAEdgeType, EPSILON
 
 
+def iter_bits(mask: int):
+    """
+    iterate indexes of set bits of a bitmask, lowest first
+    """
+    if mask.bit_count() <= 32:          # a few bits, one big int operation per bit is cheaper than formatting
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+        return
+
+    digits = bin(mask)[:1:-1]           # many bits, one pass over the mask instead of a big int operation per bit
+    idx = digits.find("1")
+    while idx >= 0:
+        yield idx
+        idx = digits.find("1", idx + 1)
+
 
 class NFA:
     """
@@ -18,6 +35,9 @@ class NFA:
         self.range_map: RangeMap = range_map
         self.__nodes: NodeInfoMap = {}
         self.__edges: NFAEdgeType = {}
+        self.__closure_masks: dict[StateType, int] = {}    # state -> ε-closure bitmask, filled on demand
+        self.__index_state: list[StateType] | None = None
+        self.__state_index: dict[StateType, int] | None = None
 
 
 
@@ -37,6 +57,7 @@ class NFA:
         :param label: 字符串标签
         :param meta: 元信息
         """
+        self.__reset_closure(True)
         self.nodes[node] = NodeInfo(accept=accept, label=label, meta=meta)
 
     def add_nodes(self, *nodes: StateType):
@@ -55,6 +76,9 @@ class NFA:
             node = dest if origin not in self.nodes else origin
             raise RuntimeError("Unknown node: " + str(node))
 
+        if edge == EPSILON:
+            self.__reset_closure()
+
         k = (origin, edge)
         if k not in self.edges:
             self.edges[k] = set()
@@ -88,30 +112,129 @@ class NFA:
             return None
         return self.edges[k]
 
-    def closure(self, nodes: frozenset[StateType] | set[StateType]) -> set[StateType]:
+    @property
+    def index_state(self) -> list[StateType]:
         """
-        epsilon闭包运算(ε-closure)
-        :param nodes:
-        :return:
+        dense index(bit position of closure masks) -> state, in node insertion order
         """
-        result: set[StateType] = set()
-        stack: [SymbolType] = list(nodes)
+        if self.__index_state is None:
+            self.__build_index()
+        return self.__index_state
 
-        while len(stack) > 0:
-            node = stack.pop()
+    @property
+    def state_index(self) -> dict[StateType, int]:
+        """
+        state -> dense index(bit position of closure masks)
+        """
+        if self.__state_index is None:
+            self.__build_index()
+        return self.__state_index
 
-            # 如果已经遍历过，跳过
-            if node in result:
-                continue
-            result.add(node)
+    def __build_index(self):
+        self.__index_state = list(self.nodes)
+        self.__state_index = {state: idx for idx, state in enumerate(self.__index_state)}
 
-            # epsilon转移
-            connect_nodes = self.translate_to(node, EPSILON)
+    def clear_closure_cache(self):
+        """
+        drop memoized closure masks, they are rebuilt on demand
+        """
+        self.__closure_masks = {}
 
-            if connect_nodes is not None:
-                stack += connect_nodes
+    def __reset_closure(self, reindex: bool = False):
+        self.__closure_masks = {}
+        if reindex:
+            self.__index_state = self.__state_index = None
 
-        return result
+    def __build_closure_masks(self, root: StateType) -> None:
+        """
+        ε-closure bitmasks of the states ε-reachable from root, on the condensation of ε-subgraph:
+        states in one strongly connected component share one closure mask,
+        tarjan emits components in reverse topological order, so successors are always ready.
+        states finished by an earlier call are not visited again
+        """
+        masks = self.__closure_masks
+        state_index = self.state_index
+        index: dict[StateType, int] = {root: 0}
+        low: dict[StateType, int] = {root: 0}
+        scc_stack: list[StateType] = [root]
+        on_stack: set[StateType] = {root}
+        empty = frozenset()
+
+        def successors(state):
+            return self.edges.get((state, EPSILON), empty)
+
+        call_stack = [(root, iter(successors(root)))]
+        while call_stack:
+            node, children = call_stack[-1]
+            for child in children:
+                if child in masks:                  # other component, already finished
+                    continue
+                if child not in index:              # recursive call
+                    index[child] = low[child] = len(index)
+                    scc_stack.append(child)
+                    on_stack.add(child)
+                    call_stack.append((child, iter(successors(child))))
+                    break
+                elif child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                call_stack.pop()
+                if call_stack:
+                    parent = call_stack[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+                if low[node] != index[node]:
+                    continue
+
+                component = []                      # node is root of a component, pop it
+                while True:
+                    item = scc_stack.pop()
+                    on_stack.discard(item)
+                    component.append(item)
+                    if item == node:
+                        break
+
+                mask = 0
+                for item in component:
+                    mask |= 1 << state_index[item]
+                for item in component:
+                    for child in successors(item):
+                        if child in masks:
+                            mask |= masks[child]
+
+                for item in component:
+                    masks[item] = mask
+
+    def closure_mask(self, node: StateType) -> int:
+        """
+        ε-closure of a single state as a bitmask over state_index, computed on first use,
+        only states actually asked for (and what they reach by ε) are memoized, one int per component.
+        cache is dropped after add_node/add_edge(ε)/concat
+        """
+        mask = self.__closure_masks.get(node)
+        if mask is None:
+            self.__build_closure_masks(node)
+            mask = self.__closure_masks[node]
+        return mask
+
+    def mask_states(self, mask: int) -> set[StateType]:
+        """
+        states of a bitmask over state_index
+        """
+        index_state = self.index_state
+        return {index_state[idx] for idx in iter_bits(mask)}
+
+    def closure(self, nodes: frozenset[StateType] | set[StateType]) -> set[StateType]:
+        """
+        epsilon闭包运算(ε-closure)
+        :param nodes:
+        :return:
+        """
+        mask = 0
+        for node in nodes:
+            mask |= self.closure_mask(node)
+
+        return self.mask_states(mask)
 
 
     def dfa_edge(self, nodes: frozenset[StateType] | set[StateType], edge: SymbolType) -> set[StateType]:
@@ -145,6 +268,7 @@ class NFA:
         :param new_nfa:
         :return:
         """
+        self.__reset_closure(True)
         self.nodes.update(new_nfa.nodes)
         self.edges.update(new_nfa.edges)
 
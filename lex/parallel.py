@@ -0,0 +1,56 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Sequence
+
+from common.token_buffer import TokenBuffer
+from lex.keyword_table import KeywordTable
+from lex.scan_engine import ScanEngine
+
+# per worker process state, set by _init_worker
+_engine: ScanEngine | None = None
+_labels: Sequence[Any] = ()
+_encoding = "utf-8"
+_keywords: KeywordTable | None = None
+
+
+def _init_worker(engine: ScanEngine, labels: Sequence[Any], encoding: str, keywords: KeywordTable | None):
+    global _engine, _labels, _encoding, _keywords
+    _engine, _labels, _encoding, _keywords = engine, labels, encoding, keywords
+
+
+def _tokenize_file(path: str) -> TokenBuffer:
+    return tokenize_file(_engine, path, _labels, _encoding, _keywords)
+
+
+def tokenize_file(engine: ScanEngine, path: str, labels: Sequence[Any] = (), encoding: str = "utf-8",
+                  keywords: KeywordTable | None = None) -> TokenBuffer:
+    """
+    :return: token buffer of the file, offsets are character offsets (line endings are kept as is)
+    """
+    with open(path, encoding=encoding, newline="") as f:
+        text = f.read()
+    buffer = engine.tokenize(text, labels)
+    if keywords is not None:
+        keywords.reclassify_buffer(buffer, text)
+    return buffer
+
+
+def tokenize_files(engine: ScanEngine, paths: list[str], labels: Sequence[Any] = (), workers: int | None = None,
+                   encoding: str = "utf-8", keywords: KeywordTable | None = None) -> list[TokenBuffer]:
+    """
+    tokenize files in a process pool,
+    the engine is pickled once per worker by the pool initializer, tasks only carry a path and return token columns
+    :param workers: number of processes, None for cpu count, 1 to run in this process
+    :return: token buffers in the order of paths
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(paths))
+
+    if workers <= 1:
+        return [tokenize_file(engine, path, labels, encoding, keywords) for path in paths]
+
+    chunk_size = max(1, len(paths) // (workers * 4))   # a few chunks per worker, balances uneven file sizes
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(engine, labels, encoding, keywords)) as executor:
+        return list(executor.map(_tokenize_file, paths, chunksize=chunk_size))
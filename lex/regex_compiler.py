@@ -14,7 +14,7 @@ from common.range_map import RangeMap
 from common.common_type import EPSILON, SymbolType, NodeInfo
 from common.work_priority_queue import WorkPriorityQueue
 from lex.dfa import DFA
-from lex.nfa import NFA
+from lex.nfa import NFA, iter_bits
 
 MAX_UNICODE_POINT = 0x10FFFF
 
@@ -350,8 +350,7 @@ class RegexLexer:
         """
 
         global MAX_UNICODE_POINT
-        range_map = RangeMap()
-        range_map.insert(0, MAX_UNICODE_POINT + 1) # cover all Unicode charset
+        cuts = {0, MAX_UNICODE_POINT + 1}   # cover all Unicode charset
 
         # I don't if it's standardized, I just don't want to nest too many
         def handle_char_class(char_ranges: set):
@@ -359,28 +358,25 @@ class RegexLexer:
                 if item == RegexLexer.HAT_CHAR:     # spacial operator ^(@^), I don't think it's good idea
                     continue
                 elif isinstance(item, str):
-                    range_map.insert_single(item)
+                    cuts.update((ord(item), ord(item) + 1))
 
                 else:
                     beg, end = ord(item[0]), ord(item[1]) + 1
                     if beg >= end:
                         raise RuntimeError(f"Bad range {item[0]}-{item[1]} at position {pos}")
-                    range_map.insert(beg, end)
+                    cuts.update((beg, end))
 
 
         for typ, val, pos in tokens:
 
             if typ == TokenType.CHAR:
-                range_map.insert_single(val)
+                cuts.update((ord(val), ord(val) + 1))
 
             elif typ == TokenType.CHAR_CLASS:
                 handle_char_class(val)
 
 
-        generator = id_generator()
-        range_map.dfs(ldr_handler=lambda node, *_: node.set_meta(generator.__next__()))
-
-        return range_map
+        return RangeMap.from_boundaries(cuts)   # metas are range ids in code point order
 
     @staticmethod
     def __calc_whole_set(range_map):
@@ -391,13 +387,15 @@ class RegexLexer:
         return whole
 
     @staticmethod
-    def __cvt2range(tokens, range_map):
+    def __cvt2range(tokens, frozen_range_map, whole_set):
         """
         convert tokens character with range id(equivalence class)
+        :param frozen_range_map: frozen range map, shared by groups
+        :param whole_set: all range ids, shared by groups
         :return: new tokens
         """
 
-        whole_set = RegexLexer.__calc_whole_set(range_map)
+        lookup = frozen_range_map.lookup
         new_tokens = []
         def handle_char_class(ranges: set):
             new_range = set()
@@ -406,10 +404,10 @@ class RegexLexer:
                     continue
 
                 if isinstance(item, str):
-                    new_range.add(range_map.search(item).meta)
+                    new_range.add(lookup(item))
                 else:
-                    beg = range_map.search(item[0]).meta
-                    end = range_map.search(item[1]).meta
+                    beg = lookup(item[0])
+                    end = lookup(item[1])
                     new_range.add(range(beg, end + 1))
 
             if RegexLexer.HAT_CHAR in ranges:        # 取反
@@ -420,7 +418,7 @@ class RegexLexer:
 
         for typ, val, pos in tokens:
             if typ == TokenType.CHAR:
-                new_tokens.append((typ, range_map.search(val).meta, pos))
+                new_tokens.append((typ, lookup(val), pos))
             elif typ == TokenType.CHAR_CLASS:
                char_ranges = handle_char_class(val)
                new_tokens.append((typ, char_ranges, pos))
@@ -437,7 +435,7 @@ class RegexLexer:
         RegexLexer.__char_class_to_range(tokens)
         range_map = RegexLexer.__build_range_map(tokens)
 
-        tokens = RegexLexer.__cvt2range(tokens, range_map)
+        tokens = RegexLexer.__cvt2range(tokens, range_map.freeze(), RegexLexer.__calc_whole_set(range_map))
 
         tokens = RegexLexer.__add_concat(tokens)
 
@@ -457,7 +455,8 @@ class RegexLexer:
         chained_tokens = chain(*map(lambda x: x[1], token_groups))
         range_map = RegexLexer.__build_range_map(chained_tokens)
 
-        token_groups = map(lambda x: (x[0], RegexLexer.__cvt2range(x[1], range_map)), token_groups)
+        frozen_range_map, whole_set = range_map.freeze(), RegexLexer.__calc_whole_set(range_map)
+        token_groups = map(lambda x: (x[0], RegexLexer.__cvt2range(x[1], frozen_range_map, whole_set)), token_groups)
         token_groups = list(map(lambda x: (x[0], RegexLexer.__add_concat(x[1])), token_groups))
 
         return token_groups, range_map
@@ -470,14 +469,33 @@ class RegexCompiler:
     Token = tuple[TokenType, str | set | int, int]
     # 正则表达式 -> token 规则
 
-    def __init__(self, generator = None):
+    class Construction(Enum):
+        THOMPSON = auto()       # ε-NFA, every operator glues fragments with ε edges
+        GLUSHKOV = auto()       # ε-free position automaton, one state per symbol position
+        DIRECT = auto()         # dfa straight from followpos, no nfa (an nfa request gets the glushkov one)
 
+    def __init__(self, generator = None, construction: Construction = Construction.THOMPSON):
+        """
+        :param generator: state id generator
+        :param construction: nfa construction of compile_group, compile is always thompson and
+                             compile_positions always glushkov
+        """
         self.__range_map = None
+        self.__frozen_range_map = None
         generator = id_generator() if generator is None else generator
 
         self.__generator = generator
+        self.__construction = construction
         self._op_stack: list[TokenType] = []
-        self._calc_stack: list[tuple[int, NFA, int]] = []
+        self._calc_stack: list[tuple] = []
+
+        # glushkov positions: position -> symbols, position -> followpos bitmask
+        self.__symbols: list[frozenset[SymbolType]] = []
+        self.__follow: list[int] = []
+
+    @property
+    def construction(self) -> Construction:
+        return self.__construction
 
     def __next_id(self):
         return next(self.__generator)
@@ -493,6 +511,10 @@ class RegexCompiler:
 
         self._calc_stack.append((start, nfa, end))
 
+    @staticmethod
+    def __flatten(tok_val) -> set[SymbolType]:
+        return {y for x in tok_val for y in (x if isinstance(x, Iterable) else {x})}
+
     def __build_char_class_nfa(self, tok_val) -> None:
 
         start = self.__next_id()
@@ -502,7 +524,7 @@ class RegexCompiler:
         nfa.add_node(start)
         nfa.add_node(end)
 
-        flattened = {y for x in tok_val for y in (x if isinstance(x, Iterable) else {x})}
+        flattened = RegexCompiler.__flatten(tok_val)
 
         for i in flattened:
             state = self.__next_id()
@@ -516,13 +538,15 @@ class RegexCompiler:
         # todo
         pass
 
-    def __build_dot_nfa(self, _):
+    def __dot_symbols(self) -> range:
         global MAX_UNICODE_POINT
 
-        beg_trans = self.__range_map.search(0).meta
-        end_trans = self.__range_map.search(MAX_UNICODE_POINT).meta
+        beg_trans = self.__frozen_range_map.lookup(0)
+        end_trans = self.__frozen_range_map.lookup(MAX_UNICODE_POINT)
+        return range(beg_trans, end_trans + 1)
 
-        self.__build_char_class_nfa(range(beg_trans, end_trans + 1))
+    def __build_dot_nfa(self, _):
+        self.__build_char_class_nfa(self.__dot_symbols())
 
 
     def __do_calc_concat(self):
@@ -535,16 +559,15 @@ class RegexCompiler:
         self._calc_stack.append((beg2, nfa2, end1))
 
     def __do_calc_alter(self) -> None:
-        nfa = NFA()
-
         try:
             beg1, nfa1, end1 = self._calc_stack.pop()
             beg2, nfa2, end2 = self._calc_stack.pop()
         except IndexError:
             raise RuntimeError("wrong |")
 
-        nfa.concat(nfa1)
-        nfa.concat(nfa2)
+        # operands are owned by the stack, merge the smaller into the larger (a long a|b|c|... chain stays linear)
+        nfa, other = (nfa1, nfa2) if len(nfa1.nodes) >= len(nfa2.nodes) else (nfa2, nfa1)
+        nfa.concat(other)
 
         beg, end = self.__next_id(), self.__next_id()
 
@@ -580,6 +603,65 @@ class RegexCompiler:
 
         self._calc_stack.append((beg, nfa, end))
 
+    def __push_position(self, symbols: Iterable[SymbolType]) -> None:
+        """
+        new position, a fragment is (nullable, firstpos bitmask, lastpos bitmask)
+        """
+        bit = 1 << len(self.__symbols)
+        self.__symbols.append(frozenset(symbols))
+        self.__follow.append(0)
+        self._calc_stack.append((False, bit, bit))
+
+    def __build_char_position(self, edge: SymbolType) -> None:
+        self.__push_position((edge,))
+
+    def __build_char_class_position(self, tok_val) -> None:
+        self.__push_position(RegexCompiler.__flatten(tok_val))
+
+    def __build_dot_position(self, _) -> None:
+        self.__push_position(self.__dot_symbols())
+
+    def __add_follow(self, last: int, first: int) -> None:
+        follow = self.__follow
+        for position in iter_bits(last):
+            follow[position] |= first
+
+    def __do_position_concat(self) -> None:
+        nullable2, first2, last2 = self._calc_stack.pop()
+        nullable1, first1, last1 = self._calc_stack.pop()
+        self.__add_follow(last1, first2)
+
+        first = first1 | first2 if nullable1 else first1
+        last = last1 | last2 if nullable2 else last2
+        self._calc_stack.append((nullable1 and nullable2, first, last))
+
+    def __do_position_alter(self) -> None:
+        try:
+            nullable2, first2, last2 = self._calc_stack.pop()
+            nullable1, first1, last1 = self._calc_stack.pop()
+        except IndexError:
+            raise RuntimeError("wrong |")
+
+        self._calc_stack.append((nullable1 or nullable2, first1 | first2, last1 | last2))
+
+    def __do_position_closure(self) -> None:
+        _, first, last = self._calc_stack.pop()
+        self.__add_follow(last, first)
+        self._calc_stack.append((True, first, last))
+
+    def __do_position_question(self) -> None:
+        _, first, last = self._calc_stack.pop()
+        self._calc_stack.append((True, first, last))
+
+    def __do_position_plus(self) -> None:
+        try:
+            nullable, first, last = self._calc_stack.pop()
+        except IndexError:
+            raise RuntimeError("")
+
+        self.__add_follow(last, first)
+        self._calc_stack.append((nullable, first, last))
+
     def __handle_left_rparen(self):
         # 计算（清空）括号
         op = self._op_stack.pop()
@@ -617,10 +699,26 @@ class RegexCompiler:
         else:
             self._op_stack.append(curr_op_typ)                  # current operator should priorly calculate
 
-    def __build_calc_map(self):
+    def __build_calc_map(self, positions: bool = False):
         # god jesus, why python syntax dependency resolver so sucks, this function is stupid
 
         # expand point, if it needs new function, change this table
+        if positions:
+            self.__CALC_MAP = {
+                TokenType.STAR: self.__do_position_closure,
+                TokenType.OR: self.__do_position_alter,
+                TokenType.AND: self.__do_position_concat,
+                TokenType.PLUS: self.__do_position_plus,
+                TokenType.QUESTION: self.__do_position_question,
+            }
+            self.__OPERAND_MAP = {
+                TokenType.CHAR: self.__build_char_position,
+                TokenType.CHAR_CLASS: self.__build_char_class_position,
+                TokenType.ESCAPE: self.__build_escape_nfa,
+                TokenType.DOT: self.__build_dot_position,
+            }
+            return
+
         self.__CALC_MAP = {
             TokenType.STAR: self.__do_calc_closure,
             TokenType.OR: self.__do_calc_alter,
@@ -629,20 +727,27 @@ class RegexCompiler:
             TokenType.QUESTION: self.__do_calc_question,
 
         }
+        self.__OPERAND_MAP = {
+            TokenType.CHAR: self.__build_char_nfa,
+            TokenType.CHAR_CLASS: self.__build_char_class_nfa,
+            TokenType.ESCAPE: self.__build_escape_nfa,
+            TokenType.DOT: self.__build_dot_nfa,
+        }
 
-    def __analysis(self, tokens: list[Token]) -> tuple[int, NFA, int]:
-        self.__build_calc_map()
+    def __evaluate(self, tokens: list[Token], positions: bool) -> tuple:
+        """
+        operator precedence evaluation of tokens, operands are nfa fragments or position fragments
+        """
+        self.__build_calc_map(positions)
         for tok in tokens:
             tok_type, tok_val, pos = tok
 
-
             # expand point
-            match tok_type:
-                case TokenType.CHAR: self.__build_char_nfa(tok_val)
-                case TokenType.CHAR_CLASS: self.__build_char_class_nfa(tok_val)
-                case TokenType.ESCAPE: self.__build_escape_nfa(tok_val)
-                case TokenType.DOT: self.__build_dot_nfa(tok_val)
-                case _: self.__handle_operator(tok_type)
+            operand = self.__OPERAND_MAP.get(tok_type)
+            if operand is not None:
+                operand(tok_val)
+            else:
+                self.__handle_operator(tok_type)
 
 
         # calculate rest of nfa
@@ -654,29 +759,92 @@ class RegexCompiler:
         if len(self._calc_stack) > 1:
             raise SyntaxError("正则解析出错")
 
+        return self._calc_stack.pop()
+
+    def __analysis(self, tokens: list[Token]) -> tuple[int, NFA, int]:
+        nfa_tuple = self.__evaluate(tokens, False)
 
         # set terminated state
-        nfa_tuple = self._calc_stack.pop()
         nfa_tuple[1].nodes[nfa_tuple[2]].accept = True
 
         return nfa_tuple
 
+    def __positions(self, tokens: list[Token]) -> tuple[bool, int, int]:
+        """
+        :return: (nullable, firstpos, lastpos) of tokens, followpos of its positions are filled
+        """
+        return self.__evaluate(tokens, True)
+
+    def __build_position_nfa(self, patterns: list[tuple[Any, tuple[bool, int, int]]], range_map) -> tuple[int, NFA]:
+        """
+        glushkov automaton of patterns: an origin and one state per position,
+        p --symbol--> q for every q in followpos(p) (origin: firstpos) and symbol of q, lastpos states accept
+        """
+        nfa = NFA(range_map)
+        origin = self.__next_id()
+        nfa.add_node(origin)
+        states = [self.__next_id() for _ in self.__symbols]
+        nfa.add_nodes(*states)
+
+        symbols = self.__symbols
+        for position, follow in enumerate(self.__follow):
+            for dest in iter_bits(follow):
+                for symbol in symbols[dest]:
+                    nfa.add_edge(states[position], states[dest], symbol)
+
+        for idx, (name, (nullable, first, last)) in enumerate(patterns):
+            for dest in iter_bits(first):
+                for symbol in symbols[dest]:
+                    nfa.add_edge(origin, states[dest], symbol)
+
+            accepts = [states[position] for position in iter_bits(last)]
+            if nullable and not nfa.nodes[origin].accept:      # earlier pattern wins the empty match
+                accepts.append(origin)
+            for state in accepts:
+                node_info = nfa.nodes[state]
+                node_info.accept = True
+                node_info.label = name
+                node_info.priority = idx
+
+        return origin, nfa
+
+    def __use_range_map(self, range_map):
+        if self.__range_map is not range_map:        # groups share one range map, freeze it only once
+            self.__frozen_range_map = range_map.freeze()
+        self.__range_map = range_map
+
     def compile(self, tokens: list[Token], range_map) -> tuple[int, NFA, int]:
         """
-        compile regex to NFA
+        compile regex to NFA (thompson construction, whatever construction is)
         :param tokens: regular expr tokens
         :param range_map: range_map generated by Lexer
         :return: (origin state, nfa, terminal state)
         """
-        self.__range_map = range_map
+        self.__use_range_map(range_map)
         result = self.__analysis(tokens)
 
         result[1].range_map = range_map
         return result
 
+    def compile_positions(self, tokens: list[Token], range_map) -> tuple[int, NFA, frozenset[int]]:
+        """
+        compile regex to the ε-free position(glushkov) NFA
+        :return: (origin state, nfa, accept states), there is no single terminal state
+        """
+        self.__use_range_map(range_map)
+        self.__symbols, self.__follow = [], []
+        origin, nfa = self.__build_position_nfa([(None, self.__positions(tokens))], range_map)
+        return origin, nfa, frozenset(state for state, node_info in nfa.nodes.items() if node_info.accept)
+
     def compile_group(self, groups: list[tuple[Any, list[Token]]], range_map):
         self._op_stack: list[TokenType] = []
-        self._calc_stack: list[tuple[int, NFA, int]] = []
+        self._calc_stack: list[tuple] = []
+
+        if self.__construction != RegexCompiler.Construction.THOMPSON:
+            self.__use_range_map(range_map)
+            self.__symbols, self.__follow = [], []
+            patterns = [(name, self.__positions(tokens)) for name, tokens in groups]
+            return self.__build_position_nfa(patterns, range_map)
 
 
         nfa_entries = [(name, self.compile(tokens, range_map)) for name, tokens in groups]
@@ -698,43 +866,141 @@ class RegexCompiler:
 
         return origin_state, combined_nfa
 
+    def __group_by_symbol(self, positions: int) -> dict[SymbolType, int]:
+        """
+        positions bitmask -> {symbol: positions reading symbol}
+        """
+        symbols = self.__symbols
+        moves: dict[SymbolType, int] = {}
+        for position in iter_bits(positions):
+            bit = 1 << position
+            for symbol in symbols[position]:
+                moves[symbol] = moves.get(symbol, 0) | bit
+        return moves
+
+    def compile_group_dfa(self, groups: list[tuple[Any, list[Token]]], range_map,
+                          enable_multi_label: bool = False) -> tuple[int, DFA]:
+        """
+        regex group -> dfa directly (dragon book followpos method), no nfa and no ε-closure:
+        a dfa state is a bitmask of positions just read, the origin is one extra bit after the last position,
+        move(state, symbol) = union of followpos(p) for p in state, restricted to positions reading symbol
+        :param enable_multi_label: labels are frozensets of all accepted names, as N2DConvertor does
+        :return: (origin state, dfa)
+        """
+        self._op_stack: list[TokenType] = []
+        self._calc_stack: list[tuple] = []
+        self.__use_range_map(range_map)
+        self.__symbols, self.__follow = [], []
+        patterns = [(name, self.__positions(tokens)) for name, tokens in groups]
+
+        origin_position = len(self.__symbols)
+        first = 0
+        accept_table: dict[int, list[int]] = defaultdict(list)     # accepting position -> pattern indexes
+        for idx, (_, (nullable, pattern_first, last)) in enumerate(patterns):
+            first |= pattern_first
+            for position in iter_bits(last):
+                accept_table[position].append(idx)
+            if nullable:
+                accept_table[origin_position].append(idx)
+
+        moves = [self.__group_by_symbol(follow) for follow in self.__follow]
+        moves.append(self.__group_by_symbol(first))
+        accept_mask = 0
+        for position in accept_table:
+            accept_mask |= 1 << position
+
+        # subset construction on position bitmasks, states are numbered in discovery order
+        origin_state = 1 << origin_position
+        state_ids: dict[int, int] = {origin_state: 0}
+        states = [origin_state]
+        edges: list[tuple[int, int, SymbolType]] = []
+        state_id = 0
+        while state_id < len(states):
+            state = states[state_id]
+            connected: dict[SymbolType, int] = {}
+            for position in iter_bits(state):
+                for symbol, mask in moves[position].items():
+                    connected[symbol] = connected.get(symbol, 0) | mask
+
+            for symbol, mask in connected.items():
+                dest = state_ids.get(mask)
+                if dest is None:
+                    dest = state_ids[mask] = len(states)
+                    states.append(mask)
+                edges.append((state_id, dest, symbol))
+            state_id += 1
+
+        dfa = DFA()
+        for state_id, state in enumerate(states):
+            accepted = sorted({idx for position in iter_bits(state & accept_mask)
+                               for idx in accept_table[position]})
+            if enable_multi_label:
+                label = frozenset(patterns[idx][0] for idx in accepted)
+            else:
+                label = patterns[accepted[0]][0] if accepted else None
+            dfa.add_node(state_id, accept=bool(accepted), label=label)
+        for origin, dest, symbol in edges:
+            dfa.add_edge(origin, dest, symbol)
+
+        dfa.range_map = range_map
+        return 0, dfa
+
 
 class N2DConvertor:
     """
-    Convert NFA to DFA
+    Convert NFA to DFA,
+    nfa states are renumbered densely, a set of nfa states (a dfa state) is an int bitmask
     """
 
+    def __init_state_index(self):
+        """
+        nfa state <-> dense index(bit position), shared with the closure masks of nfa
+        """
+        self.__index_state: list[int] = self.nfa.index_state
+        self.__state_index: dict[int, int] = self.nfa.state_index
+
     def __init_state_table(self):
         """
-        this function builds a table associating state with translation symbol(edge)
+        this function builds a table associating state with translation symbol(edge),
+        state index -> {symbol: ε-closure(move(state, symbol)) bitmask}
         """
-        for edge in self.nfa.edges:
-            state, symbol = edge
+        self.__state_table: list[dict[SymbolType, int]] = [{} for _ in self.__index_state]
+        closure_mask = self.nfa.closure_mask
+
+        for (state, symbol), dests in self.nfa.edges.items():
 
             if symbol == EPSILON:     # remove epsilon edge
                 continue
-            ele = self.__state_table.get(state, set())
-            ele.add(symbol)
-            self.__state_table[state] = ele
 
+            mask = 0
+            for dest in dests:
+                mask |= closure_mask(dest)
 
-        for node in self.nfa.nodes:
-            self.__state_table[node] = self.__state_table.get(node, set())
+            table = self.__state_table[self.__state_index[state]]
+            table[symbol] = table.get(symbol, 0) | mask
 
+        self.__accept_mask = 0
+        for idx, state in enumerate(self.__index_state):
+            if self.nfa.nodes[state].accept:
+                self.__accept_mask |= 1 << idx
 
 
     def __initialize(self):
         """
         this function initializes calculation queue (with origin_closure)
         """
+        self.__init_state_index()
         self.__init_state_table()
 
-        self.__closure_queue: deque[frozenset[int]] = deque()
-
-        self.__closure_queue.append(self.__origin_closure)  # add initial element
+        self.__origin_closure = self.nfa.closure_mask(self.origin)
 
+        # dfa state id -> nfa state bitmask, ids are given on discovery so tables never hash wide masks again
+        self.__states: list[int] = [self.__origin_closure]
+        self.__state_ids: dict[int, int] = {self.__origin_closure: 0}
 
+        self.__closure_queue: deque[int] = deque()
 
+        self.__closure_queue.append(0)  # add initial element
 
 
     def __init__(self, nfa: NFA, origin: int, enable_multi_label = False):
@@ -745,11 +1011,9 @@ class N2DConvertor:
         :param enable_multi_label: enable multi labels when conflict(multi state cast to single state) occurs
         """
         self.nfa: NFA = nfa
-        self.__state_table: dict[int, set[SymbolType]] = {}
-        self.__translate_table: dict[tuple[frozenset[int], SymbolType], frozenset[int]] = {} # 转移表，表示k闭包后的转移情况
+        self.__translate_table: dict[tuple[int, SymbolType], int] = {} # 转移表，表示k闭包后的转移情况
 
         self.origin = origin
-        self.__origin_closure = frozenset(self.nfa.closure({self.origin}))
 
         self.__enable_multi_label = enable_multi_label
 
@@ -760,54 +1024,26 @@ class N2DConvertor:
     def enable_multi_label(self):
         return self.__enable_multi_label
 
-    def __get_connected(self, states: frozenset[int]):
-        """
-        this function gets all connected edges(symbol) from set states
-        :param states:  set
-        """
-        connected_edge = set()
-        for item in states:
-            connected_edge.update(self.__state_table[item])
-        return connected_edge
-
-
 
-
-    def __subset_construct(self, state: frozenset[int]):
+    def __subset_construct(self, state_id: int):
         """
         construct subset, and add new combination of states into queue
-        :param state: multi nfa states correspond to a nfa state
+        :param state_id: dfa state, its nfa states are the bitmask states[state_id]
         """
-        connected_edge = self.__get_connected(state)
-        new_states = set()
-        for edge in connected_edge:     # foreach edges(symbols), calculate kleene_closure, fill into transition_table
-            connected = frozenset(self.nfa.subset_closure(state, edge))
-            self.__translate_table[(state, edge)] = connected
-            new_states.add(connected)
-
-        for item in new_states:         # add new state into queue
-            self.__closure_queue.append(item)
-
-
-
-    @staticmethod
-    def __build_id_map(finished_state):
-        """
-        this function builds a state-id mapping(dict)
-        :param finished_state:
-        :return: this dict
-        """
-        state_id_map = {}
-        generator = id_generator()
-
-
-        for state in finished_state:
-            state_id_map[state] = next(generator)
-
-
-        return state_id_map
-
-
+        state_table = self.__state_table
+        connected: dict[SymbolType, int] = {}
+        for idx in iter_bits(self.__states[state_id]):     # foreach edges(symbols), union precomputed closures
+            for edge, mask in state_table[idx].items():
+                connected[edge] = connected.get(edge, 0) | mask
+
+        state_ids, states = self.__state_ids, self.__states
+        for edge, mask in connected.items():                # fill into transition_table, add new state into queue
+            dest = state_ids.get(mask)
+            if dest is None:
+                dest = state_ids[mask] = len(states)
+                states.append(mask)
+                self.__closure_queue.append(dest)
+            self.__translate_table[(state_id, edge)] = dest
 
     @staticmethod
     def __min_priority(node1: NodeInfo, node2: NodeInfo):
@@ -822,15 +1058,13 @@ class N2DConvertor:
         else:
             return node1
 
-    def __build_node_info(self, states) -> NodeInfo:
+    def __build_node_info(self, state: int) -> NodeInfo:
 
         final_node = NodeInfo(False)
         temp_labels = set()
 
 
-        terminal_state = list(filter(lambda x: self.nfa.nodes[x].accept, states))
-
-        # print(terminal_state)
+        terminal_state = [self.__index_state[idx] for idx in iter_bits(state & self.__accept_mask)]
 
         for state in terminal_state:  # if it has terminated state, inherit its attribute
 
@@ -850,29 +1084,20 @@ class N2DConvertor:
 
         return final_node
 
-    def __build_dfa(self, state_id_map):
+    def __build_dfa(self):
         """
         this function is responsible for building dfa relying on transition_map
-        :param state_id_map: state-id map
         :return: dfa
         """
         dfa = DFA()
-        for state in state_id_map:          # foreach state_id_map add into dfa
-            state_id = state_id_map[state]
-
+        for state_id, state in enumerate(self.__states):          # foreach discovered state add into dfa
             node_info = self.__build_node_info(state)
 
             dfa.add_node(state_id, accept=node_info.accept, label=node_info.label, meta=node_info.meta)
 
 
 
-        for item in self.__translate_table:     # (origin, symbol) -> dest
-            origin, edge = item
-            dest = self.__translate_table[item]
-
-            origin_id = state_id_map[origin]
-            dest_id = state_id_map[dest]
-
+        for (origin_id, edge), dest_id in self.__translate_table.items():     # (origin, symbol) -> dest
             dfa.add_edge(origin_id, dest_id, edge)
 
         return dfa
@@ -886,24 +1111,73 @@ class N2DConvertor:
         :return: (origin state, dfa)
         """
 
-        finished_state = set()  # to prevent duplicate calculations, and convenient for build state-id map
-        while len(self.__closure_queue) > 0:
-            state = self.__closure_queue.popleft()
+        while len(self.__closure_queue) > 0:    # every state is queued once, when it's discovered
+            self.__subset_construct(self.__closure_queue.popleft())    # closure
 
-            if state in finished_state:  # already calculated, skip
-                continue
+        dfa = self.__build_dfa()
+        origin_state = 0          # origin_state closure(origin_state)
 
-            self.__subset_construct(state)    # closure
-            finished_state.add(state)
+        dfa.range_map = self.nfa.range_map
 
+        return origin_state, dfa
 
-        state_id_map = N2DConvertor.__build_id_map(finished_state)  # state-id map
-        dfa = self.__build_dfa(state_id_map)
-        origin_state = state_id_map[self.__origin_closure]          # origin_state closure(origin_state)
 
-        dfa.range_map = self.nfa.range_map
+class DFATrimmer:
+    """
+    Remove useless states of a DFA: states not reachable from origin, and states from which no accept state is
+    reachable (co-unreachable, dead). Edges into removed states are dropped, so they are DEAD transitions of the
+    frozen table and scanning stops at once instead of running on to a state that can't match.
+    State ids and the origin are kept, run it before minimization to give Hopcroft a smaller input.
+    """
 
-        return origin_state, dfa
+    def __init__(self, dfa: DFA, origin: int):
+        self.dfa = dfa
+        self.origin = origin
+
+    @staticmethod
+    def __search(starts: Iterable[int], adjacency: dict[int, set[int]]) -> set[int]:
+        visited = set(starts)
+        stack = list(visited)
+        while stack:
+            for dest in adjacency.get(stack.pop(), ()):
+                if dest not in visited:
+                    visited.add(dest)
+                    stack.append(dest)
+        return visited
+
+    def useful_states(self) -> set[int]:
+        """
+        :return: states both reachable and co-reachable, origin is always kept
+        """
+        forward: dict[int, set[int]] = defaultdict(set)
+        backward: dict[int, set[int]] = defaultdict(set)
+        for (state, _), dest in self.dfa.edges.items():
+            forward[state].add(dest)
+            backward[dest].add(state)
+
+        reachable = DFATrimmer.__search((self.origin,), forward)
+        accepts = (state for state, node_info in self.dfa.nodes.items() if node_info.accept)
+        co_reachable = DFATrimmer.__search(accepts, backward)
+        return (reachable & co_reachable) | {self.origin}
+
+    def trim(self) -> tuple[int, DFA]:
+        """
+        :return: (origin, trimmed dfa)
+        """
+        useful = self.useful_states()
+        if len(useful) == len(self.dfa.nodes):
+            return self.origin, self.dfa
+
+        new_dfa = DFA()
+        new_dfa.range_map = self.dfa.range_map
+        for state, node_info in self.dfa.nodes.items():
+            if state in useful:
+                new_dfa.add_node(state, node_info.accept, node_info.label, node_info.meta)
+        for (state, symbol), dest in self.dfa.edges.items():
+            if state in useful and dest in useful:
+                new_dfa.add_edge(state, dest, symbol)
+
+        return self.origin, new_dfa
 
 
 class DFAOptimizer:
@@ -947,6 +1221,7 @@ class DFAOptimizer:
         self.origin = origin
         self.__node_edge_map = {}
         self.__build_node_edge_table()
+        self.__inverse_table = self.__build_inverse_table()
         self.__label_type = label_type
         self.__generator = id_generator()
 
@@ -963,8 +1238,6 @@ class DFAOptimizer:
 
         groups = defaultdict(set)               # all divided group
 
-        terminal_set = defaultdict(set)         # terminal divided group
-
         for state, node_info in self.dfa.nodes.items():
 
             if self.label_type == self.LabelType.DISABLE:       # disable label, use accept only
@@ -974,13 +1247,7 @@ class DFAOptimizer:
 
             groups[k].add(state)                                # group to groups
 
-            if node_info.accept:
-                terminal_set[node_info.label].add(state)        # group split for terminal_set
-
-
-
-
-        return map(lambda x: frozenset(x), groups.values()), map(lambda x: frozenset(x), terminal_set.values())
+        return groups.values()
 
 
     def __get_translate_edge(self, state: int | Iterable):
@@ -995,15 +1262,26 @@ class DFAOptimizer:
             for s in state: translate_edge.update(self.__node_edge_map[s])
             return translate_edge
 
-    def __goto(self, state, symbol):
+    def __build_inverse_table(self):
+        """
+        build reverse edge table once, dest -> {symbol: sources}
+        """
+        inverse_table = defaultdict(lambda: defaultdict(list))
+        for (state, symbol), dest in self.dfa.edges.items():
+            inverse_table[dest][symbol].append(state)
+
+        return inverse_table
+
+    def __get_pre(self, min_set_: Iterable[int]) -> dict[SymbolType, set[int]]:
         """
-        same as GOTO in nfa
+        predecessors of splitter, grouped by symbol, only symbols really entering the splitter appear
         """
-        return self.dfa.translate_to(state, symbol)
+        pre = defaultdict(set)
+        for state in min_set_:
+            for symbol, sources in self.__inverse_table.get(state, {}).items():
+                pre[symbol].update(sources)
 
-    def __get_pre(self, min_set_: frozenset[int], symbol) -> frozenset[int]:
-        all_states = self.dfa.nodes.keys()
-        return frozenset({state for state in all_states if self.__goto(state, symbol) in min_set_})
+        return pre
 
 
     @staticmethod
@@ -1013,44 +1291,46 @@ class DFAOptimizer:
 
     def __minimize(self):
         """
-        hopcroft minimize algorithm
+        hopcroft minimize algorithm,
+        partition is kept as block id -> states, only blocks hit by a predecessor set are touched
         :return: state sets
         """
-        initial_split, terminated_split = self.__init_split()
+        blocks: list[set[int]] = [set(item) for item in self.__init_split() if item]   # Equivalence Class
+        block_of: dict[int, int] = {state: block_id for block_id, block in enumerate(blocks) for state in block}
 
-        block_set: set[frozenset[int]] = {item for item in initial_split if item}   # set of Equivalence Class
+        # dfa may be partial (missing edges go to an implicit dead state), so every block is a splitter
+        work_queue = WorkPriorityQueue(lambda x: len(blocks[x]))
+        work_queue.push(*range(len(blocks)))
 
 
-        work_queue = WorkPriorityQueue(lambda x: len(x))
-        work_queue.push(*terminated_split)
+        while (splitter := work_queue.pop()) is not None:
 
+            for symbol, set_a in self.__get_pre(tuple(blocks[splitter])).items():
 
-        while (min_set := work_queue.pop()) is not None:                    # almost line to line translate from origin pseudocode
-
-            for symbol in self.dfa.alphabet:
-                set_a: frozenset[int] = self.__get_pre(min_set, symbol)
-                if not set_a:
-                    continue
+                touched: dict[int, set[int]] = defaultdict(set)          # block id -> block & set_a
+                for state in set_a:
+                    touched[block_of[state]].add(state)
 
-                for block in list(block_set):
-
-                    intersect: frozenset[int] = block & set_a
-                    diff: frozenset[int] = block - set_a
-
-                    if not (intersect and diff):
+                for block_id, intersect in touched.items():
+                    block = blocks[block_id]
+                    if len(intersect) == len(block):
                         continue
 
-                    block_set.remove(block)
-                    block_set.update([intersect, diff])
+                    block -= intersect                                  # block now is diff
+                    small = DFAOptimizer.min_set(intersect, block)
+                    if small is block:                                  # keep id with the larger part
+                        blocks[block_id] = intersect
+
+                    new_id = len(blocks)
+                    blocks.append(small)
+                    for state in small:
+                        block_of[state] = new_id
 
-                    if block in work_queue:
-                        work_queue.remove(block)
-                        work_queue.push(intersect, diff)
-                    else:
-                        work_queue.push(DFAOptimizer.min_set(intersect, diff))
+                    # if block_id is waiting, both parts are waiting now, otherwise only smaller one
+                    work_queue.push(new_id)
 
 
-        return block_set
+        return {frozenset(block) for block in blocks}
 
     def __build_node_info(self, divided_set):
         """
@@ -1212,3 +1492,65 @@ class DFAOptimizer:
 
         return new_origin, self.__build_dfa(connect_table, block_id_table, node_info_table)  #build new dfa
 
+
+
+class AlphabetMerger:
+    """
+    Merge equivalent symbol columns of a DFA (character class compaction):
+    symbols with the same destination in every state are one class, range map metas are rewritten to class ids,
+    adjacent ranges of the same class are joined. Run it after minimization, the states are left untouched.
+    """
+
+    def __init__(self, dfa: DFA, origin: int):
+        if dfa.range_map is None:
+            raise RuntimeError("DFA without range map can't be merged")
+        self.dfa = dfa
+        self.origin = origin
+
+    def __build_class_table(self, ranges: list[tuple[int, int, SymbolType]]) -> dict[SymbolType, int]:
+        """
+        symbol -> class id, class ids follow the code point order of their first range
+        """
+        states = list(self.dfa.nodes)
+        edges = self.dfa.edges
+
+        signature_class = {}        # column (dest of each state) -> class id
+        class_table = {}
+        for _, _, symbol in ranges:
+            if symbol in class_table:
+                continue
+            signature = tuple(edges.get((state, symbol)) for state in states)
+            class_table[symbol] = signature_class.setdefault(signature, len(signature_class))
+
+        return class_table
+
+    @staticmethod
+    def __build_range_map(ranges: list[tuple[int, int, SymbolType]], class_table: dict[SymbolType, int]) -> RangeMap:
+        merged: list[list] = []
+        for beg, end, symbol in ranges:
+            cls = class_table[symbol]
+            if merged and merged[-1][1] == beg and merged[-1][2] == cls:
+                merged[-1][1] = end
+            else:
+                merged.append([beg, end, cls])
+
+        boundaries = [beg for beg, _, _ in merged] + [merged[-1][1]]
+        return RangeMap.from_boundaries(boundaries, (cls for _, _, cls in merged))
+
+    def merge(self) -> tuple[int, DFA]:
+        """
+        :return: (origin, dfa over merged classes)
+        """
+        ranges = []
+        self.dfa.range_map.dfs(ldr_handler=lambda node, *_: ranges.append((node.beg, node.end, node.meta)))
+        class_table = self.__build_class_table(ranges)
+
+        new_dfa = DFA()
+        new_dfa.range_map = AlphabetMerger.__build_range_map(ranges, class_table)
+        for state, node_info in self.dfa.nodes.items():
+            new_dfa.add_node(state, node_info.accept, node_info.label, node_info.meta)
+        for (state, symbol), dest in self.dfa.edges.items():
+            if (state, class_table[symbol]) not in new_dfa.edges:
+                new_dfa.add_edge(state, dest, class_table[symbol])
+
+        return self.origin, new_dfa
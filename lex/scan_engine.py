@@ -0,0 +1,151 @@
+from abc import ABC, abstractmethod
+from array import array
+from typing import Any, Iterable, Iterator, Sequence
+
+from common.token_buffer import TokenBuffer
+
+
+def decode_utf8(data, pos: int) -> tuple[int, int]:
+    """
+    decode one non-ASCII utf-8 sequence at data[pos]
+    :param data: bytes like object, indexing gives int
+    :return: (code point, byte width)
+    """
+    lead = data[pos]
+    if 0xC2 <= lead <= 0xDF:
+        width, c = 2, lead & 0x1F
+    elif 0xE0 <= lead <= 0xEF:
+        width, c = 3, lead & 0x0F
+    elif 0xF0 <= lead <= 0xF4:
+        width, c = 4, lead & 0x07
+    else:
+        raise RuntimeError(f"Invalid utf-8 byte {lead:#x} at position {pos}")
+
+    if pos + width > len(data):
+        raise RuntimeError(f"Truncated utf-8 sequence at position {pos}")
+
+    for i in range(pos + 1, pos + width):
+        b = data[i]
+        if b & 0xC0 != 0x80:
+            raise RuntimeError(f"Invalid utf-8 byte {b:#x} at position {i}")
+        c = (c << 6) | (b & 0x3F)
+
+    return c, width
+
+
+class ScanEngine(ABC):
+    """
+    maximal munch driver shared by DFATable and LazyDFA,
+    engines only provide advance(resumable dfa run), scan loops are built on it
+    """
+    DEAD = -1
+    NO_LABEL = -1
+
+    @property
+    @abstractmethod
+    def origin(self) -> int:
+        pass
+
+    @property
+    @abstractmethod
+    def labels(self) -> Sequence[Any]:
+        """
+        label index -> label
+        """
+        pass
+
+    @abstractmethod
+    def advance(self, text: str, pos: int, state: int) -> tuple[int, int, int, int]:
+        """
+        run dfa from state over text[pos:], until a dead transition or the end of text,
+        scanning can be resumed with more text from the returned state
+        :return: (state, pos, last_label, last_end)
+            state is DEAD if stopped by a dead transition, pos is where it stops,
+            last_label is the label index of the last accepted position in this run (NO_LABEL if none)
+        """
+        pass
+
+    @abstractmethod
+    def advance_bytes(self, data, pos: int, state: int) -> tuple[int, int, int, int]:
+        """
+        same as advance, but over utf-8 encoded bytes(bytes, mmap, memoryview), positions are byte offsets
+        """
+        pass
+
+    def scan(self, text: str, pos: int = 0) -> Iterator[tuple[Any, int, int]]:
+        """
+        maximal munch over text, the longest accepted lexeme wins, then restart at origin
+        :param text: source text
+        :param pos: start position
+        :return: iterator of (label, start, end), lexeme is text[start:end]
+        """
+        advance, labels, origin = self.advance, self.labels, self.origin
+        length = len(text)
+
+        while pos < length:
+            _, _, last_label, last_end = advance(text, pos, origin)
+
+            if last_label < 0:
+                raise RuntimeError(f"Unexpected character {text[pos]!r} at position {pos}")
+
+            yield labels[last_label], pos, last_end
+            pos = last_end
+
+    def scan_bytes(self, data, pos: int = 0) -> Iterator[tuple[Any, int, int]]:
+        """
+        maximal munch over utf-8 encoded bytes, nothing is decoded or copied
+        :return: iterator of (label, start, end), offsets are byte offsets
+        """
+        advance, labels, origin = self.advance_bytes, self.labels, self.origin
+        length = len(data)
+
+        while pos < length:
+            _, _, last_label, last_end = advance(data, pos, origin)
+
+            if last_label < 0:
+                raise RuntimeError(f"Unexpected byte {data[pos]:#x} at position {pos}")
+
+            yield labels[last_label], pos, last_end
+            pos = last_end
+
+    def tokenize(self, text: str, labels: Iterable[Any] = ()) -> TokenBuffer:
+        """
+        maximal munch over text into a columnar token buffer, no per token object is allocated
+        :param labels: labels registered in the buffer first, fixes the kind numbering
+        :return: buffer of (label, start, end, line), line is 0 based
+        """
+        return self.tokenize_batch((text,), labels)[0]
+
+    def tokenize_batch(self, texts: Iterable[str], labels: Iterable[Any] = ()) -> tuple[TokenBuffer, array]:
+        """
+        tokenize many texts into one columnar token buffer, tokens never cross the end of a text
+        :param labels: labels registered in the buffer first, fixes the kind numbering
+        :return: (buffer, bounds), tokens of texts[i] are buffer[bounds[i]:bounds[i + 1]],
+                 their offsets and lines are relative to texts[i]
+        """
+        buffer = TokenBuffer(labels)
+        kind_of, append_kind = buffer.kind_of, buffer.append_kind
+        engine_labels = self.labels
+        kinds = [kind_of(label) for label in engine_labels]
+        origin = self.origin
+        bounds = array('i', [0])
+
+        advance = self.advance
+        for text in texts:
+            count_lines = text.count
+            pos, line, length = 0, 0, len(text)
+
+            while pos < length:
+                _, _, last_label, last_end = advance(text, pos, origin)
+                if last_label < 0:
+                    raise RuntimeError(f"Unexpected character {text[pos]!r} at position {pos}")
+
+                if last_label >= len(kinds):        # lazy dfa discovers labels while scanning
+                    kinds.extend(kind_of(label) for label in engine_labels[len(kinds):])
+                append_kind(kinds[last_label], pos, last_end, line)
+                line += count_lines("\n", pos, last_end)
+                pos = last_end
+
+            bounds.append(len(buffer))
+
+        return buffer, bounds
@@ -0,0 +1,120 @@
+import codecs
+from typing import Any
+
+from lex.dfa_table import DFATable
+from lex.lazy_dfa import LazyDFA
+
+StreamToken = tuple[Any, int, int, str]
+
+
+class StreamScanner:
+    """
+    Push based maximal munch scanner, text is fed chunk by chunk.
+    DFA state of the pending lexeme is carried across chunks, so a token cut by a chunk boundary is never rescanned,
+    only text from the start of the pending lexeme is kept: memory is O(longest token + chunk).
+    While the pending lexeme is alive, chunks are only collected and joined once when it ends,
+    so a token spanning many chunks costs O(token), not O(token²).
+    Tokens are (label, start, end, lexeme), offsets are absolute in the whole stream.
+    Binary chunks are decoded incrementally, a character cut by a chunk boundary waits for the next chunk.
+    """
+
+    def __init__(self, engine: DFATable | LazyDFA, encoding: str = "utf-8"):
+        """
+        :param encoding: encoding of binary chunks
+        """
+        self.__engine = engine
+        self.__encoding = encoding
+        self.__decoder = None                   # created by the first binary chunk
+        self.__buffer = ""                      # pending text, buffer[0] is the start of pending lexeme
+        self.__pieces: list[str] = []           # scanned chunks after buffer, not joined yet
+        self.__offset = 0                       # absolute offset of buffer[0]
+        self.__pos = 0                          # scanned position in buffer + pieces
+        self.__state = engine.origin
+        self.__last_label = engine.NO_LABEL     # last accepted (label, end) of pending lexeme
+        self.__last_end = 0
+        self.__closed = False
+
+    @property
+    def pending(self) -> int:
+        """
+        number of characters kept for the pending lexeme
+        """
+        return len(self.__buffer) + sum(map(len, self.__pieces))
+
+    def __join(self, chunk: str = ""):
+        self.__pieces.append(chunk)
+        self.__buffer = "".join((self.__buffer, *self.__pieces))
+        self.__pieces.clear()
+
+    def __drain(self, final: bool) -> list[StreamToken]:
+        engine = self.__engine
+        labels, origin, no_label = engine.labels, engine.origin, engine.NO_LABEL
+        buffer, offset = self.__buffer, self.__offset
+        state, pos = self.__state, self.__pos
+        last_label, last_end = self.__last_label, self.__last_end
+        start = 0
+        tokens: list[StreamToken] = []
+
+        while start < len(buffer):
+            state, pos, label, end = engine.advance(buffer, pos, state)
+            if label != no_label:
+                last_label, last_end = label, end
+
+            if state >= 0 and not final:        # alive at the end of buffer, wait for more text
+                break
+
+            if last_label == no_label:
+                raise RuntimeError(f"Unexpected character {buffer[start]!r} at position {offset + start}")
+
+            tokens.append((labels[last_label], offset + start, offset + last_end, buffer[start:last_end]))
+            start = pos = last_end
+            state, last_label = origin, no_label
+
+        # drop consumed text only once per drain, slicing per token would be quadratic
+        self.__buffer = buffer[start:]
+        self.__offset = offset + start
+        self.__pos = pos - start
+        self.__last_end = last_end - start
+        self.__state, self.__last_label = state, last_label
+
+        return tokens
+
+    def feed(self, chunk: str | bytes) -> list[StreamToken]:
+        """
+        :param chunk: text, or encoded bytes
+        :return: tokens completed by this chunk
+        """
+        if self.__closed:
+            raise RuntimeError("Scanner is closed")
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            if self.__decoder is None:
+                self.__decoder = codecs.getincrementaldecoder(self.__encoding)()
+            chunk = self.__decoder.decode(chunk)
+        if not chunk:
+            return []
+
+        # all pending text is scanned, pos is at its end: run on from there over the chunk alone
+        engine = self.__engine
+        state, pos, label, end = engine.advance(chunk, 0, self.__state)
+        if state >= 0:                          # pending lexeme still alive, no token can end yet
+            if label != engine.NO_LABEL:
+                self.__last_label, self.__last_end = label, self.__pos + end
+            self.__pieces.append(chunk)
+            self.__state = state
+            self.__pos += pos
+            return []
+
+        self.__join(chunk)
+        return self.__drain(False)
+
+    def close(self) -> list[StreamToken]:
+        """
+        end of stream, flush the pending lexeme
+        :return: rest tokens
+        """
+        if self.__closed:
+            return []
+        self.__join(self.__decoder.decode(b"", final=True) if self.__decoder is not None else "")
+        tokens = self.__drain(True)
+        self.__closed = True
+        return tokens
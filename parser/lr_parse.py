@@ -9,6 +9,7 @@ from dataclasses import dataclass
 from exceptiongroup import catch
 
 from common.IdGenerator import id_generator
+from common.table_compress import CombTable
 from parser.parser_type import Production, PARSER_END, LRItem, PARSER_EPSILON, ProductionItem, ParseToken
 from parser.util import compute_first_set
 
@@ -47,6 +48,15 @@ class LR1Parser:
 
         self.action_goto_table = self.__parse()
 
+    def compress_table(self, default_reductions: bool = True) -> CombTable:
+        """
+        action_goto_table compressed by row displacement, table[(state, token)] / table.get(state, token) as the dict
+        :param default_reductions: the most common reduce of a state answers its error entries too,
+                                   errors are found before the next shift instead of at once
+        """
+        reducible = (lambda cell: cell.cell_type == ParserType.REDUCE) if default_reductions else None
+        return CombTable.from_mapping(self.action_goto_table, reducible)
+
     def __build_production_table(self):
         """
         production name -> production alternatives table
@@ -3,6 +3,7 @@ Recursive descent Parser
 """
 from dataclasses import dataclass
 
+from common.token_buffer import TokenBuffer
 from parser.parser_type import Production, PARSER_EPSILON, ProductionItem, LRItem
 
 
@@ -14,6 +15,11 @@ class SyntaxNode:
 class RDParser:
 
     def __init__(self, text, productions: list[Production], init_expr: str):
+        """
+        :param text: sequence of terminal names, or a TokenBuffer whose labels are terminal names
+        """
+        if isinstance(text, TokenBuffer):
+            text = text.label_view()
         self.__text = text
         self.__production_dict = {p.name: p for p in productions}
         self.__idx = 0
@@ -51,61 +51,21 @@ token_spec = [
 #     print( lex.dfa.nodes[state])
 
 
-def match(text: str):
-    lex = Lexer(token_spec)
-    # print(len(lex.dfa.nodes))
-    # print(lex.dfa.edges.__len__())
-    line_num = 0
-    idx = 0
+# built once, every match call reuses its frozen tables
+lex = Lexer(token_spec)
 
-    state = lex.origin
-    last_pos = None
-    last_state = None
-    start_pos = None
 
+def match(text: str):
     result: list[Token] = []
-    total_size = 0
-
-    for line_num, line in enumerate(text.splitlines(keepends=True)):
-        total_size += len(line)
-        # print(total_size)
-        while idx < total_size:
-            c = text[idx]
-            if c == '\n':
-                c = ' '
-
-            s = lex.dfa.range_map.search(c).meta
-            state = lex.dfa.translate_to(state, s)
-
-
-
-            if state is None:
-                if last_state is None:
-                    raise RuntimeError(f"Unexpected character {c} at line {line_num}:\n {line}\n" + "-" * (idx - total_size + len(line) + 1) + "|")
-
-                label = lex.dfa.nodes[last_state].label
-                result.append(Token(label, text[start_pos:last_pos+1], line_num))
-                start_pos = last_pos + 1
-                state = lex.origin
-                idx = last_pos
-                last_state = None
-
-
-            if lex.dfa.nodes[state].accept:
-                # print( lex.dfa.nodes[state])
-                last_state = state
-                last_pos = idx
-
-            idx += 1
-
-
-    if state is not None and lex.dfa.nodes[state].accept:
-        label = lex.dfa.nodes[state].label
-        result.append(Token(label, text[start_pos:last_pos+1], line_num))
-        state = lex.origin
-
-    if state is not None and state != lex.origin:
-        raise RuntimeError(f"Unknown: {text[last_pos:]}")
+    line_num = 0
+    last_end = 0
+
+    # no pattern for '\n', scan it as a space, lexemes are still sliced from the original text
+    for kind, start_pos, end_pos in lex.scan(text.replace("\n", " ")):
+        line_num += text.count("\n", last_end, start_pos)
+        result.append(Token(kind, text[start_pos:end_pos], line_num))
+        line_num += text.count("\n", start_pos, end_pos)
+        last_end = end_pos
 
     return result
 